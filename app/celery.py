@@ -1,8 +1,10 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.schedules import crontab
+from kombu import Queue
 from celery.app.log import TaskFormatter as CeleryTaskFormatter
-from celery.signals import after_setup_task_logger, after_setup_logger
+from celery.signals import after_setup_task_logger, after_setup_logger, worker_process_init, worker_ready
 from celery._state import get_current_task
 import logging
 import re
@@ -14,8 +16,47 @@ app = Celery('bot')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# Latency classes: replies to live users, fan-out to many users, and slow
+# catalog work. Each queue has its own workers in docker-compose.yml, so a
+# broadcast or a feed sync never delays a search reply.
 app.conf.update(
-    task_default_queue='sender'
+    task_queues=(
+        Queue('interactive'),
+        Queue('bulk'),
+        Queue('maintenance'),
+    ),
+    task_default_queue='interactive',
+    task_routes={
+        'bot.tasks.send_message_the_first': {'queue': 'interactive'},
+        'bot.tasks.send_message_districts': {'queue': 'interactive'},
+        'bot.tasks.send_message_not_found': {'queue': 'interactive'},
+        'bot.tasks.send_message_before_searching': {'queue': 'interactive'},
+        'bot.tasks.send_message_medication_buttons': {'queue': 'interactive'},
+        'bot.tasks.send_message_search_result': {'queue': 'interactive'},
+        'bot.tasks.send_message_pharmacy_address': {'queue': 'interactive'},
+        'bot.tasks.send_message_product_of_the_day': {'queue': 'interactive'},
+        'bot.tasks.subscribe_price_drop': {'queue': 'interactive'},
+        'bot.tasks.send_message_basket': {'queue': 'interactive'},
+        'bot.tasks.send_message_nearest_pharmacies': {'queue': 'interactive'},
+        'bot.tasks.notify_price_drops': {'queue': 'bulk'},
+        'bot.tasks.send_broadcast': {'queue': 'bulk'},
+        'bot.tasks.sync_price_feed': {'queue': 'maintenance'},
+        'bot.tasks.import_uploaded_price_list': {'queue': 'maintenance'},
+        'bot.tasks.refresh_chain_offers': {'queue': 'maintenance'},
+    },
+    # stock changes refresh their chain offers incrementally, the full
+    # rebuild only catches what bypassed the ORM and the importers
+    beat_schedule={
+        'refresh-chain-offers': {'task': 'bot.tasks.refresh_chain_offers', 'schedule': crontab(hour=4, minute=0)},
+    },
+    # tasks are short, a worker reserving many of them would keep them waiting
+    # while an idle replica could take them
+    worker_prefetch_multiplier=1,
+    # replies are acknowledged on receipt, a redelivered one would be sent twice;
+    # bulk tasks opt into acks_late because they are safe to repeat
+    task_acks_late=False,
+    task_reject_on_worker_lost=True,
+    worker_disable_rate_limits=True,
 )
 
 
@@ -45,3 +86,16 @@ class TaskFormatter(CeleryTaskFormatter):
 def setup_task_logger(logger, *args, **kwargs):
     for handler in logger.handlers:
         handler.setFormatter(TaskFormatter('[%(asctime)s] %(short_task_id)s [%(levelname)s] %(message)s'))
+
+
+@worker_process_init.connect
+def start_medication_index(*args, **kwargs):
+    from bot.index import medication_index
+    medication_index.start()
+
+
+@worker_ready.connect
+def start_medication_index_in_threads(sender, *args, **kwargs):
+    # the prefork pool starts the index in every child instead
+    if not sender.controller.pool_cls.__module__.endswith('prefork'):
+        start_medication_index()
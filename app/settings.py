@@ -49,9 +49,9 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'bot',
     'django_admin_inline_paginator',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
@@ -62,9 +62,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# the toolbar middleware is sync only and would run the async webhook view in a thread
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -170,6 +174,19 @@ CELERY_TIMEZONE = 'Europe/Kiev'
 
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 X_TELEGRAM_BOT_API_SECRET_TOKEN = os.environ.get('X_TELEGRAM_BOT_API_SECRET_TOKEN')
+# 'inline' handles updates in the webhook, 'stream' only queues them for the consume_updates command
+TELEGRAM_INGESTION = os.environ.get('TELEGRAM_INGESTION', 'inline')
+TELEGRAM_STREAM_SHARDS = int(os.environ.get('TELEGRAM_STREAM_SHARDS', 16))
+TELEGRAM_STREAM_MAXLEN = int(os.environ.get('TELEGRAM_STREAM_MAXLEN', 100000))
+TELEGRAM_SENDER_CONNECTIONS = int(os.environ.get('TELEGRAM_SENDER_CONNECTIONS', 100))
+TELEGRAM_SENDER_TIMEOUT = float(os.environ.get('TELEGRAM_SENDER_TIMEOUT', 30))
+TELEGRAM_SENDER_RETRIES = int(os.environ.get('TELEGRAM_SENDER_RETRIES', 5))
+# messages per second, TELEGRAM_GROUP_RATE is per minute
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_CHAT_BURST = int(os.environ.get('TELEGRAM_CHAT_BURST', 3))
+TELEGRAM_GROUP_RATE = float(os.environ.get('TELEGRAM_GROUP_RATE', 20))
+TELEGRAM_BULK_RESERVE = int(os.environ.get('TELEGRAM_BULK_RESERVE', 10))
 
 LOGGING = {
     'version': 1,
@@ -193,7 +210,10 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'INFO',
             'propagate': True,
-        }
+        },
+        'httpx': {
+            'level': 'WARNING',
+        },
     },
 }
 
@@ -25,9 +25,11 @@ from bot.views import telegram_webhook
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('qm4uzepgTJhMy9c0wJt2Lyingbyt1qvbciSwsDEmx', telegram_webhook),
-    path('__debug__/', include('debug_toolbar.urls')),
 ]
 
+if settings.DEBUG:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
+
 
 # urlpatterns += [
 #     path('media/<path:path>', serve, {'document_root': settings.MEDIA_ROOT}),
@@ -1,10 +1,17 @@
+import uuid
 from django.contrib import admin
+from django.core.files.storage import default_storage
 from bot.models import Pharmacy, Medication, PharmacyStock, District, Address, \
-    Phone, Chain, ProductOfTheDay, Form, Unit
+    Phone, Chain, ProductOfTheDay, Form, Unit, PriceFeed, PriceSubscription, Broadcast
 from django.utils.translation import gettext_lazy as _
-from bot.forms import MedicationForm, PharmacyStockForm, PharmacyForm
+from bot.forms import MedicationForm, PharmacyStockForm, PharmacyForm, PriceListImportForm
+from bot import history
+from bot.tasks import send_broadcast, sync_price_feed, import_uploaded_price_list
 from django_admin_inline_paginator.admin import TabularInlinePaginated
 from django.db.models import Q
+from django.urls import path
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.utils.html import mark_safe
 
 
@@ -13,6 +20,9 @@ admin.site.site_title = _('Medication Bot')
 admin.site.index_title = _('Medication Bot')
 
 
+PRICE_LIST_UPLOAD_DIR = 'price_lists'
+
+
 class BaseAdmin(admin.ModelAdmin):
     def get_search_results(self, request, queryset, search_term):
         if search_term:
@@ -38,7 +48,7 @@ class DistrictAdmin(admin.ModelAdmin):
 
 
 class AddressAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'latitude', 'longitude')
     search_fields = ('name',)
     list_display_links = ('name',)
 
@@ -110,6 +120,11 @@ class PharmacyAdmin(admin.ModelAdmin):
                 i.save()
         super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        # the price changes of the stock inline go to the history with one INSERT
+        with history.batch():
+            super().save_related(request, form, formsets, change)
+
     def copy_action(self, request, queryset):
         for obj in queryset:
             previous_phone = obj.phone.all()
@@ -159,6 +174,23 @@ class PharmacyStockAdmin(BaseAdmin):
         self.message_user(request, _('Selected records were copied successfully'))
     copy_action.short_description = _('Copy chosen records')
 
+    def get_urls(self):
+        urls = [path('import/', self.admin_site.admin_view(self.import_view), name='bot_pharmacystock_import')]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        form = PriceListImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            file = form.cleaned_data['file']
+            # the maintenance worker shares the media volume, nginx does not serve this directory
+            path = default_storage.save(f'{PRICE_LIST_UPLOAD_DIR}/{uuid.uuid4().hex}_{file.name}', file)
+            import_uploaded_price_list.delay(path, file.name)
+            self.message_user(request, _('Import of the price list was started'))
+            return redirect('admin:bot_pharmacystock_changelist')
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta,
+                       title=_('Import price list'))
+        return TemplateResponse(request, 'admin/bot/pharmacystock/import.html', context)
+
 
 class ProductOfTheDayAdmin(BaseAdmin):
     autocomplete_fields = ('pharmacy', 'medication')
@@ -168,6 +200,51 @@ class ProductOfTheDayAdmin(BaseAdmin):
     per_page = 100
 
 
+class PriceFeedAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'is_active', 'synced')
+    search_fields = ('name',)
+    list_display_links = ('name',)
+    list_filter = ('is_active',)
+    actions = ('sync_action',)
+
+    def sync_action(self, request, queryset):
+        for feed in queryset:
+            sync_price_feed.delay(feed.id)
+        self.message_user(request, _('Sync of the selected feeds was started'))
+    sync_action.short_description = _('Sync chosen feeds')
+
+
+class PriceSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'medication', 'district', 'threshold', 'is_active', 'notified')
+    search_fields = ('user__id', 'medication__name')
+    list_display_links = ('user', 'medication')
+    list_filter = ('is_active', 'district')
+    autocomplete_fields = ('medication',)
+    raw_id_fields = ('user',)
+    per_page = 100
+
+
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'text', 'status', 'sent', 'blocked', 'failed', 'created', 'finished')
+    list_display_links = ('id', 'text')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'last_user_id', 'sent', 'blocked', 'failed', 'finished')
+    actions = ('start_action', 'pause_action')
+
+    def start_action(self, request, queryset):
+        for broadcast in queryset.exclude(status=Broadcast.FINISHED):
+            # a paused broadcast drops the claim of a chunk whose task was lost
+            Broadcast.objects.filter(id=broadcast.id).exclude(status=Broadcast.RUNNING).update(status=Broadcast.RUNNING, claimed_by='')
+            send_broadcast.delay(broadcast.id)
+        self.message_user(request, _('Selected broadcasts were started'))
+    start_action.short_description = _('Start or resume chosen broadcasts')
+
+    def pause_action(self, request, queryset):
+        queryset.filter(status=Broadcast.RUNNING).update(status=Broadcast.PAUSED)
+        self.message_user(request, _('Selected broadcasts were paused'))
+    pause_action.short_description = _('Pause chosen broadcasts')
+
+
 admin.site.register(Chain, ChainAdmin)
 admin.site.register(District, DistrictAdmin)
 admin.site.register(Address, AddressAdmin)
@@ -178,3 +255,6 @@ admin.site.register(PharmacyStock, PharmacyStockAdmin)
 admin.site.register(ProductOfTheDay, ProductOfTheDayAdmin)
 admin.site.register(Form, FormAdmin)
 admin.site.register(Unit, UnitAdmin)
+admin.site.register(PriceFeed, PriceFeedAdmin)
+admin.site.register(PriceSubscription, PriceSubscriptionAdmin)
+admin.site.register(Broadcast, BroadcastAdmin)
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from django.db import connection
+from django.utils import timezone
+from bot.models import PriceSubscription
+
+
+MATCH_BATCH_SIZE = 10000
+
+# Changed (medication, district) pairs are joined to the active subscriptions
+# through the pricesubscription_match index, a subscription without district
+# matches every district. Only the matched subscriptions get their current
+# minimum price computed.
+MATCH_SUBSCRIPTIONS = '''
+    WITH changed AS (
+        SELECT * FROM unnest(%s::bigint[], %s::bigint[]) AS changed(medication_id, district_id)
+    ), subscriptions AS (
+        SELECT subscription.id, subscription.user_id, subscription.medication_id,
+               subscription.district_id, subscription.threshold
+        FROM bot_pricesubscription subscription
+        JOIN changed ON changed.medication_id = subscription.medication_id
+        AND (changed.district_id = subscription.district_id OR subscription.district_id IS NULL)
+        WHERE subscription.is_active
+        GROUP BY subscription.id
+    )
+    SELECT subscription.id, subscription.user_id, subscription.medication_id, offer.price
+    FROM subscriptions subscription
+    CROSS JOIN LATERAL (
+        SELECT min(stock.price) AS price
+        FROM bot_pharmacystock stock
+        JOIN bot_pharmacy pharmacy ON pharmacy.id = stock.pharmacy_id
+        WHERE stock.medication_id = subscription.medication_id
+        AND (pharmacy.district_id = subscription.district_id OR subscription.district_id IS NULL)
+    ) offer
+    WHERE offer.price < subscription.threshold
+'''
+
+
+def match_price_drops(changes):
+    """Deactivate the subscriptions the changes dropped below their threshold, returns {user_id: [(medication_id, price), ...]}."""
+    matched = {}
+    with connection.cursor() as cursor:
+        for i in range(0, len(changes), MATCH_BATCH_SIZE):
+            medication_ids, district_ids = zip(*changes[i:i + MATCH_BATCH_SIZE])
+            cursor.execute(MATCH_SUBSCRIPTIONS, [list(medication_ids), list(district_ids)])
+            for subscription_id, user_id, medication_id, price in cursor.fetchall():
+                matched[subscription_id] = (user_id, medication_id, price)
+    if not matched:
+        return {}
+    PriceSubscription.objects.filter(id__in=list(matched)).update(is_active=False, notified=timezone.now())
+    matches = defaultdict(list)
+    for user_id, medication_id, price in matched.values():
+        matches[user_id].append((medication_id, price))
+    return dict(matches)
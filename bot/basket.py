@@ -0,0 +1,87 @@
+import numpy as np
+from bot.models import PharmacyStock
+
+
+BASKET_LIMIT = 10
+SPLIT_BLOCK_SIZE = 1024
+MISSING_PRICE = 1e9
+
+
+def load_matrix(medication_ids, district):
+    """Prices of the medications as a pharmacy x medication matrix, missing prices are inf."""
+    stocks = PharmacyStock.objects.filter(medication_id__in=medication_ids, pharmacy__isnull=False)
+    if district != 'all':
+        stocks = stocks.filter(pharmacy__district_id=district)
+    rows = list(stocks.values_list('pharmacy_id', 'pharmacy__chain_id', 'medication_id', 'price'))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, len(medication_ids)))
+    pharmacy_ids, chain_ids, stock_medication_ids, prices = zip(*rows)
+    pharmacies, pharmacy_index = np.unique(np.array(pharmacy_ids, dtype=np.int64), return_inverse=True)
+    medication_index = np.searchsorted(np.array(medication_ids, dtype=np.int64), np.array(stock_medication_ids, dtype=np.int64))
+    matrix = np.full((len(pharmacies), len(medication_ids)), np.inf)
+    matrix[pharmacy_index, medication_index] = np.array(prices, dtype=np.float64)
+    chains = np.empty(len(pharmacies), dtype=np.int64)
+    chains[pharmacy_index] = chain_ids
+    return pharmacies, chains, matrix
+
+
+def cheapest_split(matrix):
+    """Cheapest pair of pharmacies covering all columns, returns (i, j, total)."""
+    columns = matrix.shape[1]
+    subsets = np.arange(1, 2 ** columns - 1)
+    if not len(matrix) or not len(subsets):
+        return None, None, np.inf
+    masks = (subsets[None, :] >> np.arange(columns)[:, None]) & 1
+    # inf * 0 is nan, a missing price is a huge finite one for the product
+    finite = np.where(np.isfinite(matrix), matrix, MISSING_PRICE)
+    best = np.full(len(subsets), np.inf)
+    best_index = np.zeros(len(subsets), dtype=np.int64)
+    for start in range(0, len(finite), SPLIT_BLOCK_SIZE):
+        totals = finite[start:start + SPLIT_BLOCK_SIZE] @ masks
+        index = np.argmin(totals, axis=0)
+        cheaper = totals[index, np.arange(len(subsets))] < best
+        best[cheaper] = totals[index, np.arange(len(subsets))][cheaper]
+        best_index[cheaper] = index[cheaper] + start
+    # the complement of subset s is the subset at the mirrored position
+    split_totals = best + best[::-1]
+    s = int(np.argmin(split_totals))
+    if split_totals[s] >= MISSING_PRICE:
+        return None, None, np.inf
+    i, j = best_index[s], best_index[::-1][s]
+    return i, j, np.minimum(matrix[i], matrix[j]).sum()
+
+
+def optimize(medication_ids, district):
+    """Cheapest single pharmacy, chain and two-stop split for the medications in the district, None where impossible."""
+    medication_ids = sorted(set(medication_ids))
+    result = {'pharmacy': None, 'chain': None, 'split': None}
+    if not medication_ids:
+        return result
+    pharmacies, chains, matrix = load_matrix(medication_ids, district)
+    if not len(pharmacies):
+        return result
+
+    totals = matrix.sum(axis=1)
+    best = int(np.argmin(totals))
+    if np.isfinite(totals[best]):
+        result['pharmacy'] = {'pharmacy_id': int(pharmacies[best]), 'total': round(float(totals[best]), 2)}
+
+    chain_ids, chain_index = np.unique(chains, return_inverse=True)
+    chain_matrix = np.full((len(chain_ids), len(medication_ids)), np.inf)
+    np.minimum.at(chain_matrix, chain_index, matrix)
+    chain_totals = chain_matrix.sum(axis=1)
+    best = int(np.argmin(chain_totals))
+    if np.isfinite(chain_totals[best]):
+        result['chain'] = {'chain_id': int(chain_ids[best]), 'total': round(float(chain_totals[best]), 2)}
+
+    i, j, total = cheapest_split(matrix)
+    single = totals.min()
+    if np.isfinite(total) and i != j and total < single:
+        first = matrix[i] <= matrix[j]
+        result['split'] = {
+            'pharmacy_ids': [int(pharmacies[i]), int(pharmacies[j])],
+            'medication_ids': [[m for m, f in zip(medication_ids, first) if f],
+                               [m for m, f in zip(medication_ids, first) if not f]],
+            'total': round(float(total), 2),
+        }
+    return result
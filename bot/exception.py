@@ -1,6 +1,12 @@
-class ResponseException(Exception):
+class BotException(Exception):
+    def __init__(self, *args, status=None):
+        super().__init__(*args)
+        self.status = status
+
+
+class ResponseException(BotException):
     pass
 
 
-class TelegramException(Exception):
+class TelegramException(BotException):
     pass
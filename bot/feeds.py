@@ -0,0 +1,151 @@
+import os
+import tempfile
+from email.utils import formatdate
+from urllib.parse import urlparse
+import requests
+from django.db import connection, transaction
+from django.utils import timezone
+from bot.models import PharmacyStock, PriceFeed
+from bot.imports import PriceListImporter, read_rows, BATCH_SIZE
+from bot.index import publish
+from bot.misc import batched
+from bot.search import bump_catalog_version
+from bot import history
+from bot.offers import refresh_offers
+
+
+FETCH_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+
+# Removed stock is deleted without the per-row signals, changed() publishes it once
+DELETE_STOCKS = 'DELETE FROM bot_pharmacystock WHERE id = ANY(%s)'
+
+
+def fetch(feed):
+    """Open the price list of a feed, or return None when it has not changed since the last sync."""
+    if feed.url.startswith(('http://', 'https://')):
+        headers = {}
+        if feed.etag:
+            headers['If-None-Match'] = feed.etag
+        if feed.last_modified:
+            headers['If-Modified-Since'] = feed.last_modified
+        with requests.get(feed.url, headers=headers, stream=True, timeout=FETCH_TIMEOUT) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            file = tempfile.TemporaryFile()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+        file.seek(0)
+        return file, response.headers.get('ETag', ''), response.headers.get('Last-Modified', '')
+    path = urlparse(feed.url).path if feed.url.startswith('file://') else feed.url
+    last_modified = formatdate(os.stat(path).st_mtime, usegmt=True)
+    if last_modified == feed.last_modified:
+        return None
+    return open(path, 'rb'), '', last_modified
+
+
+class FeedSync(PriceListImporter):
+    """Applies a price list to PharmacyStock as a diff, writing only the inserted, changed and removed rows."""
+
+    def __init__(self):
+        super().__init__()
+        self.stocks = {}
+        self.seen = set()
+        self.inserts = {}
+        self.changes = {}
+        self.medication_ids = set()
+        self.report.update(unchanged=0)
+
+    def load(self, pharmacy_id):
+        if pharmacy_id not in self.stocks:
+            self.stocks[pharmacy_id] = {
+                medication_id: (stock_id, checksum) for medication_id, stock_id, checksum in
+                PharmacyStock.objects.filter(pharmacy_id=pharmacy_id).values_list('medication_id', 'id', 'checksum')
+            }
+        return self.stocks[pharmacy_id]
+
+    def diff(self, batch):
+        for pharmacy_id, medication_id, price in self.resolve_medications(batch):
+            key = (pharmacy_id, medication_id)
+            checksum = PharmacyStock.make_checksum(price)
+            stock = self.load(pharmacy_id).get(medication_id)
+            if stock is None:
+                self.inserts[key] = price
+            elif stock[1] != checksum:
+                self.changes[key] = (stock[0], price, checksum)
+            else:
+                self.changes.pop(key, None)
+            self.seen.add(key)
+
+    def removals(self):
+        for pharmacy_id, stocks in self.stocks.items():
+            for medication_id, (stock_id, _) in stocks.items():
+                if (pharmacy_id, medication_id) not in self.seen:
+                    self.medication_ids.add(medication_id)
+                    yield stock_id
+
+    def apply(self):
+        removed = list(self.removals())
+        now = timezone.now()
+        for batch in batched(list(self.inserts.items()), BATCH_SIZE):
+            PharmacyStock.objects.bulk_create([
+                PharmacyStock(pharmacy_id=pharmacy_id, medication_id=medication_id, price=price,
+                              checksum=PharmacyStock.make_checksum(price), created=now, updated=now)
+                for (pharmacy_id, medication_id), price in batch
+            ])
+        for batch in batched(list(self.changes.values()), BATCH_SIZE):
+            PharmacyStock.objects.bulk_update([
+                PharmacyStock(id=stock_id, price=price, checksum=checksum, updated=now)
+                for stock_id, price, checksum in batch
+            ], ['price', 'checksum', 'updated'])
+        prices = [(pharmacy_id, medication_id, price) for (pharmacy_id, medication_id), price in self.inserts.items()]
+        prices += [(pharmacy_id, medication_id, price) for (pharmacy_id, medication_id), (_, price, _) in self.changes.items()]
+        for batch in batched(prices, BATCH_SIZE):
+            history.write(batch, now)
+        with connection.cursor() as cursor:
+            for batch in batched(removed, BATCH_SIZE):
+                cursor.execute(DELETE_STOCKS, [batch])
+        self.medication_ids.update(medication_id for _, medication_id in self.inserts)
+        self.medication_ids.update(medication_id for _, medication_id in self.changes)
+        refresh_offers(self.medication_ids)
+        self.report.update(inserted=len(self.inserts), updated=len(self.changes), deleted=len(removed),
+                           unchanged=len(self.seen) - len(self.inserts) - len(self.changes))
+
+    def run(self, rows):
+        with transaction.atomic():
+            batch = []
+            for row in rows:
+                self.report['rows'] += 1
+                parsed = self.parse(row)
+                if parsed is None:
+                    self.report['skipped'] += 1
+                    continue
+                batch.append(parsed)
+                if len(batch) >= BATCH_SIZE:
+                    self.diff(batch)
+                    batch = []
+            self.diff(batch)
+            self.apply()
+            if self.medication_ids:
+                transaction.on_commit(self.changed)
+        return self.report
+
+    def changed(self):
+        bump_catalog_version()
+        if len(self.medication_ids) > BATCH_SIZE:
+            publish(reload=True)
+        else:
+            publish(medications=sorted(self.medication_ids))
+
+
+def sync_feed(feed):
+    """Sync one PriceFeed, returns the diff report or None when the feed has not changed."""
+    fetched = fetch(feed)
+    if fetched is None:
+        return None
+    file, etag, last_modified = fetched
+    with file:
+        report = FeedSync().run(read_rows(file, urlparse(feed.url).path or feed.url))
+    PriceFeed.objects.filter(id=feed.id).update(etag=etag, last_modified=last_modified, synced=timezone.now())
+    return report
@@ -69,3 +69,10 @@ class PharmacyForm(forms.ModelForm):
     class Meta:
         model = Pharmacy
         fields = '__all__'
+
+
+class PriceListImportForm(forms.Form):
+    file = forms.FileField(
+        label=_('Price list'),
+        help_text=_('CSV or XLSX file with the columns: chain, address, name, dosage, units, quantity, form, price'),
+    )
@@ -0,0 +1,105 @@
+import heapq
+import math
+import threading
+from bot.models import Pharmacy
+from bot.misc import version, bump_version
+
+
+EARTH_RADIUS = 6371.0
+GEO_VERSION_KEY = 'geo_version'
+
+
+def to_point(latitude, longitude):
+    """Unit vector of a coordinate, the straight line distance between vectors grows with the great circle one."""
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS * math.asin(min(chord / 2, 1.0))
+
+
+def geo_version():
+    return version(GEO_VERSION_KEY)
+
+
+def bump_geo_version():
+    return bump_version(GEO_VERSION_KEY)
+
+
+class KDTree:
+    """3-d tree over unit vectors. Nodes are (point, id, axis, left, right) tuples."""
+
+    def __init__(self, items):
+        self.root = self._build(list(items), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda i: i[0][axis])
+        median = len(items) // 2
+        point, item_id = items[median]
+        return (point, item_id, axis, self._build(items[:median], depth + 1), self._build(items[median + 1:], depth + 1))
+
+    def nearest(self, point, k, accept):
+        """The k accepted ids closest to the point as sorted (chord distance, id) pairs."""
+        heap = []
+
+        def visit(node):
+            if node is None:
+                return
+            node_point, item_id, axis, left, right = node
+            diff = point[axis] - node_point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if accept(item_id):
+                distance = sum((a - b) ** 2 for a, b in zip(point, node_point))
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, item_id))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, item_id))
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((math.sqrt(-distance), item_id) for distance, item_id in heap)
+
+
+class PharmacyLocator:
+    """In-memory KD-tree of the pharmacies with coordinates, rebuilt after the geo version is bumped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = None
+        self._points = {}
+        self._version = None
+
+    def tree(self):
+        version = geo_version()
+        with self._lock:
+            if self._tree is None or self._version != version:
+                pharmacies = (Pharmacy.objects
+                              .filter(address__latitude__isnull=False, address__longitude__isnull=False)
+                              .values_list('id', 'address__latitude', 'address__longitude'))
+                self._points = {i: to_point(latitude, longitude) for i, latitude, longitude in pharmacies}
+                self._tree = KDTree((point, i) for i, point in self._points.items())
+                self._version = version
+            return self._tree, self._points
+
+    def nearest(self, latitude, longitude, k, pharmacy_ids):
+        """Return [(distance in km, pharmacy id), ...] of the k nearest pharmacies among pharmacy_ids."""
+        tree, points = self.tree()
+        point = to_point(latitude, longitude)
+        # the tree visits about k * len(points) / len(pharmacy_ids) nodes to find k of pharmacy_ids,
+        # below sqrt(k * len(points)) of them measuring each one directly is cheaper
+        if len(pharmacy_ids) ** 2 < k * len(points):
+            found = heapq.nsmallest(k, (
+                (math.dist(point, points[i]), i) for i in pharmacy_ids if i in points
+            ))
+        else:
+            found = tree.nearest(point, k, pharmacy_ids.__contains__)
+        return [(chord_to_km(chord), i) for chord, i in found]
+
+
+pharmacy_locator = PharmacyLocator()
@@ -0,0 +1,139 @@
+import logging
+import re
+from bot.misc import Update, reply, delay
+from bot.tasks import send_message_search_result, send_message_districts, \
+    send_message_product_of_the_day, send_message_medication_buttons, \
+    send_message_pharmacy_address, the_first_message, not_found_message, \
+    before_searching_message, subscribe_price_drop, send_message_basket, \
+    send_message_nearest_pharmacies
+from bot.models import User
+from bot.search import afind_medications
+from bot.session import UserSession
+from bot.basket import BASKET_LIMIT
+from bot import texts
+
+
+async def create_new_user(from_user):
+    if not await User.objects.filter(id=from_user.id).aexists():
+        user = await User.objects.acreate(
+            id=from_user.id,
+            username=from_user.username if from_user.username else None,
+            first_name=from_user.first_name if from_user.first_name else None,
+            last_name=from_user.last_name if from_user.last_name else None,
+        )
+        logging.info(f'Create new user: {user.id} {user.username} {user.first_name} {user.last_name}')
+    # a user who blocked the bot and came back is included in broadcasts again
+    elif await User.objects.filter(id=from_user.id, is_deleted=True).aupdate(is_deleted=False):
+        logging.info(f'User {from_user.id} is back')
+
+
+async def handle_update(update):
+    """Process one parsed update, returns a Bot API call to answer with or None."""
+    body = Update(update)
+    logging.debug('%s', update)
+
+    if body.message.location:
+        message = body.message
+        logging.info(f'Incoming location from: {message.from_user.id} {message.from_user.username}')
+        medication_id = (await UserSession.aload(message.from_user.id))['medication']
+        if not medication_id:
+            return reply('sendMessage', chat_id=message.from_user.id, parse_mode='HTML', text=texts.nearest_before_search)
+        await delay(send_message_nearest_pharmacies, message.from_user.id, medication_id,
+                    message.location.latitude, message.location.longitude)
+        return
+
+    if body.message.text:
+        message = body.message
+        logging.info(f'Incoming message from: {message.from_user.id} {message.from_user.username}, {message.text}')
+
+        if message.text == '/start':
+            await create_new_user(message.from_user)
+            return reply('sendMessage', **the_first_message(message.from_user.id))
+
+        if message.text == texts.search_by_medication_button:
+            await UserSession(message.from_user.id).aupdate(delete=('district',))
+            await delay(send_message_districts, message.from_user.id)
+            return
+
+        if message.text == texts.product_of_the_day_button:
+            await delay(send_message_product_of_the_day, message.from_user.id)
+            return
+
+        session = await UserSession.aload(message.from_user.id)
+        district = session.district
+        if not district:
+            return reply('sendMessage', **the_first_message(message.from_user.id, start=False))
+
+        if message.text == texts.basket_button:
+            basket = session.get('basket', [])
+            if not basket:
+                return reply('sendMessage', chat_id=message.from_user.id, parse_mode='HTML', text=texts.basket_empty)
+            await delay(send_message_basket, message.from_user.id, basket, district)
+            return
+
+        if '⠀' in message.text:  # U2800
+            text = re.sub(r'💊|⠀', '', message.text).strip()
+            medication_id = session.get('buttons', {}).get(text)
+            logging.info(f'User {message.from_user.id} selected medication: {medication_id} {text}')
+            if not medication_id:
+                return reply('sendMessage', **not_found_message(message.from_user.id))
+            await delay(send_message_search_result, message.from_user.id, medication_id, district=district)
+
+        elif len(message.text) >= 3:
+            logging.info(f'User {message.from_user.id} searching: {message.text}')
+            medication_ids = await afind_medications(message.text, district)
+            if not medication_ids:
+                return reply('sendMessage', **not_found_message(message.from_user.id))
+            await delay(send_message_medication_buttons, message.from_user.id, medication_ids)
+
+        else:
+            return reply('sendMessage', **before_searching_message(message.from_user.id))
+
+    if body.callback_query:
+        message = body.callback_query
+        logging.info(f'Incoming callback_query from: {message.from_user.id} '
+                     f'{message.from_user.username}, {message.data}')
+        data = body.callback_query.data
+
+        if 'district' in data:
+            _, district_id = data.split('_')
+            logging.info(f'User {message.from_user.id} selected district: {data}')
+            await UserSession(message.from_user.id).aupdate(district=district_id)
+            return reply('sendMessage', **before_searching_message(message.from_user.id))
+
+        elif 'chain' in data:
+            _, chain_id = data.split('_')
+            logging.info(f'User {message.from_user.id} selected chain: {chain_id}')
+            session = await UserSession.aload(message.from_user.id)
+            await delay(send_message_pharmacy_address, message.from_user.id, chain_id,
+                        district=session.district, result=session['result'])
+
+        elif 'page' in data:
+            _, medication_id, page = data.split('_')
+            logging.info(f'User {message.from_user.id} selected page {page} of medication {medication_id}')
+            session = await UserSession.aload(message.from_user.id)
+            await delay(send_message_search_result, message.from_user.id, int(medication_id), int(page),
+                        message.message.message_id, district=session.district)
+
+        elif 'subscribe' in data:
+            _, medication_id = data.split('_')
+            logging.info(f'User {message.from_user.id} subscribed to price drops of medication {medication_id}')
+            session = await UserSession.aload(message.from_user.id)
+            await delay(subscribe_price_drop, message.from_user.id, int(medication_id), district=session.district)
+
+        elif 'basket' in data:
+            session = await UserSession.aload(message.from_user.id)
+            basket = session.get('basket', [])
+            if data == 'basket_clear':
+                await session.aupdate(delete=('basket',))
+                return reply('sendMessage', chat_id=message.from_user.id, parse_mode='HTML', text=texts.basket_cleared)
+            _, _, medication_id = data.split('_')
+            logging.info(f'User {message.from_user.id} added medication {medication_id} to the basket')
+            if int(medication_id) not in basket:
+                if len(basket) >= BASKET_LIMIT:
+                    return reply('sendMessage', chat_id=message.from_user.id, parse_mode='HTML',
+                                 text=texts.basket_full.format(count=BASKET_LIMIT))
+                basket.append(int(medication_id))
+                await session.aupdate(basket=basket)
+            return reply('sendMessage', chat_id=message.from_user.id, parse_mode='HTML',
+                         text=texts.basket_added.format(count=len(basket)))
@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from django.db import connection, transaction
+from django.db.models import Min, Avg, Max
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from bot.models import PriceHistory
+
+
+# Rows come as arrays, chain and district are taken from the pharmacy
+INSERT_HISTORY = '''
+    INSERT INTO bot_pricehistory (pharmacy_id, medication_id, chain_id, district_id, price, changed)
+    SELECT row.pharmacy_id, row.medication_id, pharmacy.chain_id, pharmacy.district_id, row.price, %s
+    FROM unnest(%s::bigint[], %s::bigint[], %s::numeric[]) AS row(pharmacy_id, medication_id, price)
+    JOIN bot_pharmacy pharmacy ON pharmacy.id = row.pharmacy_id
+    RETURNING medication_id, district_id
+'''
+
+CREATE_PARTITION = '''
+    CREATE TABLE IF NOT EXISTS bot_pricehistory_{name} PARTITION OF bot_pricehistory
+    FOR VALUES FROM (%s) TO (%s)
+'''
+
+_partitions = set()
+_local = threading.local()
+
+
+def ensure_partition(when):
+    """Create the monthly partition of bot_pricehistory holding the given moment."""
+    start = datetime(when.year, when.month, 1, tzinfo=when.tzinfo)
+    if start in _partitions:
+        return
+    end = datetime(when.year + when.month // 12, when.month % 12 + 1, 1, tzinfo=when.tzinfo)
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_PARTITION.format(name=start.strftime('y%Ym%m')), [start, end])
+    _partitions.add(start)
+
+
+def write(rows, changed=None):
+    """Append (pharmacy_id, medication_id, price) rows to the price history with one INSERT."""
+    rows = [row for row in rows if row[0] is not None]
+    if not rows:
+        return
+    changed = changed or timezone.now()
+    ensure_partition(changed)
+    pharmacy_ids, medication_ids, prices = zip(*rows)
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_HISTORY, [changed, list(pharmacy_ids), list(medication_ids), list(prices)])
+        notify(set(cursor.fetchall()))
+
+
+def notify(changes):
+    """Match the price subscriptions of changed (medication_id, district_id) pairs once the transaction commits."""
+    if changes:
+        from bot.tasks import notify_price_drops  # not at the top, bot.tasks depends on most bot modules
+        changes = [list(i) for i in changes]
+        transaction.on_commit(lambda: notify_price_drops.delay(changes))
+
+
+def record(pharmacy_id, medication_id, price):
+    """Append a price change, or buffer it until the enclosing batch() ends."""
+    rows = getattr(_local, 'rows', None)
+    if rows is None:
+        write([(pharmacy_id, medication_id, price)])
+    else:
+        rows.append((pharmacy_id, medication_id, price))
+
+
+@contextmanager
+def batch():
+    """Write the price changes recorded inside the block with one INSERT, like the stock inline of a pharmacy."""
+    if getattr(_local, 'rows', None) is not None:
+        yield
+        return
+    rows = _local.rows = []
+    try:
+        yield
+    finally:
+        _local.rows = None
+    # in the transaction of the changes, so a rollback drops them together
+    write(rows)
+
+
+def price_series(medication_id, start, end, district_id=None, chain_id=None, period='day'):
+    """Minimum, average and maximum recorded price of a medication per period, chain and district."""
+    queryset = PriceHistory.objects.filter(medication_id=medication_id, changed__gte=start, changed__lt=end)
+    if district_id is not None:
+        queryset = queryset.filter(district_id=district_id)
+    if chain_id is not None:
+        queryset = queryset.filter(chain_id=chain_id)
+    return list(
+        queryset.annotate(period=Trunc('changed', period))
+        .values('period', 'chain_id', 'district_id')
+        .annotate(min_price=Min('price'), avg_price=Avg('price'), max_price=Max('price'))
+        .order_by('period', 'chain_id', 'district_id')
+    )
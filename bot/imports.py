@@ -0,0 +1,183 @@
+import csv
+import io
+import itertools
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.utils import timezone
+from bot.models import Pharmacy, Medication, Unit, Form, normalize
+from bot.index import publish
+from bot.search import bump_catalog_version
+from bot import history
+from bot.offers import refresh_offers
+
+
+COLUMNS = ('chain', 'address', 'name', 'dosage', 'units', 'quantity', 'form', 'price')
+BATCH_SIZE = 10000
+
+CREATE_STAGING = '''
+    CREATE TEMPORARY TABLE price_list_staging (
+        line bigserial,
+        pharmacy_id bigint NOT NULL,
+        medication_id bigint NOT NULL,
+        price numeric(10, 2) NOT NULL
+    ) ON COMMIT DROP
+'''
+
+# Every inserted or changed price is appended to the price history
+MERGE_STAGING = '''
+    WITH merged AS (
+        INSERT INTO bot_pharmacystock (pharmacy_id, medication_id, price, checksum, created, updated)
+        SELECT DISTINCT ON (pharmacy_id, medication_id) pharmacy_id, medication_id, price, md5(price::text), now(), now()
+        FROM price_list_staging
+        ORDER BY pharmacy_id, medication_id, line DESC
+        ON CONFLICT ON CONSTRAINT unique_pharmacy_medication DO UPDATE
+        SET price = EXCLUDED.price, checksum = EXCLUDED.checksum, updated = EXCLUDED.updated
+        WHERE bot_pharmacystock.price IS DISTINCT FROM EXCLUDED.price
+        RETURNING pharmacy_id, medication_id, price, updated, xmax = 0 AS inserted
+    ), history AS (
+        INSERT INTO bot_pricehistory (pharmacy_id, medication_id, chain_id, district_id, price, changed)
+        SELECT merged.pharmacy_id, merged.medication_id, pharmacy.chain_id, pharmacy.district_id, merged.price, merged.updated
+        FROM merged JOIN bot_pharmacy pharmacy ON pharmacy.id = merged.pharmacy_id
+        RETURNING medication_id, district_id
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted),
+           (SELECT array_agg(DISTINCT ARRAY[medication_id, district_id]) FROM history)
+    FROM merged
+'''
+
+DELETE_MISSING = '''
+    WITH deleted AS (
+        DELETE FROM bot_pharmacystock stock
+        WHERE stock.pharmacy_id IN (SELECT DISTINCT pharmacy_id FROM price_list_staging)
+        AND NOT EXISTS (
+            SELECT 1 FROM price_list_staging staging
+            WHERE staging.pharmacy_id = stock.pharmacy_id AND staging.medication_id = stock.medication_id
+        )
+        RETURNING medication_id
+    )
+    SELECT count(*), array_agg(DISTINCT medication_id) FROM deleted
+'''
+
+
+def read_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    header = text.readline()
+    dialect = csv.Sniffer().sniff(header, delimiters=',;\t')
+    yield from csv.DictReader(itertools.chain([header], text), dialect=dialect)
+
+
+def read_xlsx(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('openpyxl is required to import .xlsx price lists')
+    rows = load_workbook(file, read_only=True, data_only=True).active.iter_rows(values_only=True)
+    header = [str(i) if i is not None else '' for i in next(rows, ())]
+    for row in rows:
+        yield dict(zip(header, row))
+
+
+def read_rows(file, name):
+    """Stream the rows of a CSV or XLSX price list as dicts keyed by COLUMNS."""
+    reader = read_xlsx if name.lower().endswith('.xlsx') else read_csv
+    for row in reader(file):
+        yield {str(k).strip().lower(): '' if v is None else str(v).strip() for k, v in row.items() if k is not None}
+
+
+def parse_number(value, number_type):
+    value = value.replace(',', '.').replace(' ', '')
+    return number_type(Decimal(value)) if value else None
+
+
+class PriceListImporter:
+    """Streams a price list into PharmacyStock, the last line wins when it repeats a (pharmacy, medication) pair."""
+
+    def __init__(self):
+        self.pharmacies = {(chain, address or ''): i for chain, address, i in
+                           Pharmacy.objects.values_list('chain__name', 'address__name', 'id')}
+        self.units = dict(Unit.objects.values_list('name', 'id'))
+        self.forms = dict(Form.objects.values_list('name', 'id'))
+        self.medications = {(name, dosage, quantity): i for name, dosage, quantity, i in
+                            Medication.objects.values_list('name', 'dosage', 'quantity', 'id')}
+        self.report = {'rows': 0, 'skipped': 0, 'medications': 0, 'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    def parse(self, row):
+        try:
+            pharmacy_id = self.pharmacies[(row['chain'], row['address'])]
+            price = parse_number(row['price'], Decimal)
+            dosage = parse_number(row.get('dosage', ''), float)
+            quantity = parse_number(row.get('quantity', ''), int)
+        except (KeyError, ValueError, InvalidOperation):
+            return None
+        if not row.get('name') or not price or price <= 0:
+            return None
+        units_id = self.get_or_create(Unit, self.units, row.get('units'))
+        form_id = self.get_or_create(Form, self.forms, row.get('form'))
+        # bulk_create skips save(), so the denormalized names are set here
+        display_name = Medication.format_name(row['name'], dosage, row.get('units'), quantity, row.get('form'))
+        medication = Medication(name=row['name'], dosage=dosage, units_id=units_id, quantity=quantity, form_id=form_id,
+                                display_name=display_name, search_key=normalize(row['name']))
+        return pharmacy_id, medication, price
+
+    def get_or_create(self, model, lookup, name):
+        if not name:
+            return None
+        if name not in lookup:
+            lookup[name] = model.objects.get_or_create(name=name)[0].id
+        return lookup[name]
+
+    def resolve_medications(self, batch):
+        """Replace the unsaved medications of parsed rows by ids, creating the unknown ones in one query."""
+        missing = {}
+        for _, medication, _ in batch:
+            key = (medication.name, medication.dosage, medication.quantity)
+            if key not in self.medications:
+                missing.setdefault(key, medication)
+        for key, medication in zip(missing, Medication.objects.bulk_create(missing.values())):
+            self.medications[key] = medication.id
+        self.report['medications'] += len(missing)
+        return [(pharmacy_id, self.medications[(medication.name, medication.dosage, medication.quantity)], price)
+                for pharmacy_id, medication, price in batch]
+
+    def flush(self, cursor, batch):
+        if not batch:
+            return
+        buffer = io.StringIO()
+        for pharmacy_id, medication_id, price in self.resolve_medications(batch):
+            buffer.write(f'{pharmacy_id}\t{medication_id}\t{price}\n')
+        buffer.seek(0)
+        cursor.copy_expert('COPY price_list_staging (pharmacy_id, medication_id, price) FROM STDIN', buffer)
+
+    def run(self, rows):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGING)
+            batch = []
+            for row in rows:
+                self.report['rows'] += 1
+                parsed = self.parse(row)
+                if parsed is None:
+                    self.report['skipped'] += 1
+                    continue
+                batch.append(parsed)
+                if len(batch) >= BATCH_SIZE:
+                    self.flush(cursor, batch)
+                    batch = []
+            self.flush(cursor, batch)
+            cursor.execute('ANALYZE price_list_staging')
+            history.ensure_partition(timezone.now())
+            cursor.execute(MERGE_STAGING)
+            self.report['inserted'], self.report['updated'], changes = cursor.fetchone()
+            history.notify(changes)
+            cursor.execute(DELETE_MISSING)
+            self.report['deleted'], deleted = cursor.fetchone()
+            refresh_offers({i[0] for i in changes or ()} | set(deleted or ()))
+            transaction.on_commit(self.changed)
+        return self.report
+
+    def changed(self):
+        bump_catalog_version()
+        publish(reload=True)
+
+
+def import_price_list(file, name):
+    return PriceListImporter().run(read_rows(file, name))
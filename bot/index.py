@@ -0,0 +1,151 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.db import close_old_connections
+from django_redis import get_redis_connection
+from bot.models import Medication, PharmacyStock, normalize
+
+
+CHANNEL = 'medication_index'
+NGRAM = 3
+RECONNECT_DELAY = 5
+
+
+def ngrams(text):
+    if len(text) < NGRAM:
+        return {text}
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def publish(**message):
+    get_redis_connection('default').publish(CHANNEL, json.dumps(message))
+
+
+class MedicationIndex:
+    """In-memory trigram index of medication names with per-district availability, kept in sync over Redis pub/sub."""
+
+    def __init__(self):
+        self.ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._names = {}
+        self._labels = {}
+        self._grams = defaultdict(set)
+        self._districts = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='medication-index', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                self.rebuild()
+                for message in pubsub.listen():
+                    self.apply(json.loads(message['data']))
+            except Exception as e:
+                logging.exception(e)
+                self.ready = False
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                close_old_connections()
+
+    def _load(self, medication_ids=None):
+        medications = Medication.objects.all()
+        stocks = PharmacyStock.objects.filter(pharmacy__isnull=False)
+        if medication_ids is not None:
+            medications = medications.filter(id__in=medication_ids)
+            stocks = stocks.filter(medication_id__in=medication_ids)
+        districts = defaultdict(set)
+        for medication_id, district_id in stocks.values_list('medication_id', 'pharmacy__district_id').distinct():
+            districts[medication_id].add(str(district_id))
+        return {i: (search_key, label) for i, search_key, label in
+                medications.values_list('id', 'search_key', 'display_name').iterator()}, districts
+
+    def rebuild(self):
+        medications, districts = self._load()
+        grams = defaultdict(set)
+        for medication_id, (name, _) in medications.items():
+            for gram in ngrams(name):
+                grams[gram].add(medication_id)
+        with self._lock:
+            self._names = {k: v[0] for k, v in medications.items()}
+            self._labels = {k: v[1] for k, v in medications.items()}
+            self._grams = grams
+            self._districts = dict(districts)
+            self.ready = True
+        logging.info(f'Medication index built: {len(medications)} medications')
+
+    def apply(self, message):
+        if message.get('reload'):
+            self.rebuild()
+            return
+        medication_ids = message.get('medications', [])
+        medications, districts = self._load(medication_ids)
+        with self._lock:
+            for medication_id in medication_ids:
+                self._remove(medication_id)
+            for medication_id, (name, label) in medications.items():
+                self._names[medication_id] = name
+                self._labels[medication_id] = label
+                for gram in ngrams(name):
+                    self._grams[gram].add(medication_id)
+                if districts[medication_id]:
+                    self._districts[medication_id] = districts[medication_id]
+
+    def _remove(self, medication_id):
+        name = self._names.pop(medication_id, None)
+        self._labels.pop(medication_id, None)
+        self._districts.pop(medication_id, None)
+        if name is None:
+            return
+        for gram in ngrams(name):
+            self._grams[gram].discard(medication_id)
+            if not self._grams[gram]:
+                del self._grams[gram]
+
+    def search(self, query, district, limit):
+        """Return ranked medication ids or None while the index is cold."""
+        if not self.ready:
+            return None
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            postings = sorted((self._grams.get(i, ()) for i in ngrams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+            found = []
+            for medication_id in candidates:
+                name = self._names[medication_id]
+                available = self._districts.get(medication_id)
+                if query not in name or not available or (district != 'all' and district not in available):
+                    continue
+                found.append((not name.startswith(query), f' {query}' not in name, name, medication_id))
+        return [i[-1] for i in sorted(found)[:limit]]
+
+    def labels(self, medication_ids):
+        """Return {id: display name} or None while the index is cold."""
+        if not self.ready:
+            return None
+        with self._lock:
+            if not all(i in self._labels for i in medication_ids):
+                return None
+            return {i: self._labels[i] for i in medication_ids}
+
+
+medication_index = MedicationIndex()
+
+
+def medication_labels(medication_ids):
+    """Return {id: display name} from the index, or from the database while the index is cold."""
+    labels = medication_index.labels(medication_ids)
+    if labels is None:
+        labels = dict(Medication.objects.filter(id__in=medication_ids).values_list('id', 'display_name'))
+    return labels
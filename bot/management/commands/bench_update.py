@@ -0,0 +1,110 @@
+import json
+import timeit
+from django.core.management.base import BaseCommand
+from bot.misc import Update, loads
+
+
+UPDATES = {
+    'start': {
+        'update_id': 712405601,
+        'message': {
+            'message_id': 2101,
+            'from': {'id': 381204455, 'is_bot': False, 'first_name': 'Ольга', 'last_name': 'Коваленко',
+                     'username': 'olga_k', 'language_code': 'ru'},
+            'chat': {'id': 381204455, 'first_name': 'Ольга', 'last_name': 'Коваленко', 'username': 'olga_k',
+                     'type': 'private'},
+            'date': 1702215461,
+            'text': '/start',
+            'entities': [{'offset': 0, 'length': 6, 'type': 'bot_command'}],
+        },
+    },
+    'search': {
+        'update_id': 712405602,
+        'message': {
+            'message_id': 2102,
+            'from': {'id': 381204455, 'is_bot': False, 'first_name': 'Ольга', 'last_name': 'Коваленко',
+                     'username': 'olga_k', 'language_code': 'ru'},
+            'chat': {'id': 381204455, 'first_name': 'Ольга', 'last_name': 'Коваленко', 'username': 'olga_k',
+                     'type': 'private'},
+            'date': 1702215490,
+            'text': 'Нурофен',
+        },
+    },
+    'callback_query': {
+        'update_id': 712405603,
+        'callback_query': {
+            'id': '1637293004816592101',
+            'from': {'id': 381204455, 'is_bot': False, 'first_name': 'Ольга', 'last_name': 'Коваленко',
+                     'username': 'olga_k', 'language_code': 'ru'},
+            'message': {
+                'message_id': 2103,
+                'from': {'id': 6512093321, 'is_bot': True, 'first_name': 'Аптека в кармане',
+                         'username': 'pharmacy_pocket_bot'},
+                'chat': {'id': 381204455, 'first_name': 'Ольга', 'last_name': 'Коваленко', 'username': 'olga_k',
+                         'type': 'private'},
+                'date': 1702215495,
+                'text': '💊 Нурофен, 200 мг, 12 таблетки\n\n🏥 Бажаємо здоров\'я 💵 85.40 грн.',
+                'reply_markup': {'inline_keyboard': [
+                    [{'text': 'Подробно: Бажаємо здоров\'я', 'callback_data': 'chain_3'}],
+                    [{'text': 'Подробно: Аптека Доброго дня', 'callback_data': 'chain_7'}],
+                    [{'text': 'Далее ▶️', 'callback_data': 'page_1542_2'}],
+                ]},
+            },
+            'chat_instance': '-4512903349871652',
+            'data': 'chain_3',
+        },
+    },
+}
+
+
+class Empty():
+    def __bool__(self):
+        return False
+
+    def __getattr__(self, name):
+        return Empty()
+
+    def __repr__(self):
+        return 'False'
+
+
+class DotAccessibleDict(dict):
+    """The update model used before bot.misc.Update, kept as the baseline."""
+
+    def __init__(self, dictionary):
+        for key, value in dictionary.items():
+            if key == 'from':
+                key = 'from_user'
+            if isinstance(value, dict):
+                self.__dict__[key] = DotAccessibleDict(value)
+            else:
+                self.__dict__[key] = value
+            self[key] = value
+
+    def __getattr__(self, name):
+        return Empty()
+
+
+def access(body):
+    # the attributes the webhook reads for every update
+    if body.message.text:
+        return body.message.from_user.id, body.message.from_user.username, body.message.text
+    if body.callback_query:
+        return body.callback_query.from_user.id, body.callback_query.data, body.callback_query.message.message_id
+
+
+class Command(BaseCommand):
+    help = 'Compare parsing and reading Telegram updates with DotAccessibleDict and Update'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        for name, update in UPDATES.items():
+            raw = json.dumps(update).encode()
+            assert access(DotAccessibleDict(json.loads(raw))) == access(Update(loads(raw)))
+            baseline = timeit.timeit(lambda: access(DotAccessibleDict(json.loads(raw))), number=number)
+            current = timeit.timeit(lambda: access(Update(loads(raw))), number=number)
+            self.stdout.write(f'{name:<15} DotAccessibleDict {baseline / number * 1e6:6.2f} us  '
+                              f'Update {current / number * 1e6:6.2f} us  x{baseline / current:.1f}')
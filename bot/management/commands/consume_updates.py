@@ -0,0 +1,23 @@
+import asyncio
+import socket
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bot.index import medication_index
+from bot.stream import consume
+
+
+class Command(BaseCommand):
+    help = 'Process Telegram updates appended to the Redis streams by the webhook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', help='Comma separated shard numbers, all shards by default')
+        parser.add_argument('--name', default=socket.gethostname(), help='Consumer name, must be stable across restarts')
+
+    def handle(self, *args, **options):
+        if options['shards']:
+            shards = [int(i) for i in options['shards'].split(',')]
+        else:
+            shards = list(range(settings.TELEGRAM_STREAM_SHARDS))
+        medication_index.start()
+        self.stdout.write(f'Consuming shards {shards} as {options["name"]}')
+        asyncio.run(consume(shards, options['name']))
@@ -0,0 +1,39 @@
+from decimal import InvalidOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bot.models import Address
+from bot.imports import read_rows, parse_number, BATCH_SIZE
+from bot.geo import bump_geo_version
+
+
+class Command(BaseCommand):
+    help = 'Import address coordinates from a geocoded CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with the columns address, latitude, longitude')
+
+    def handle(self, *args, **options):
+        addresses = dict(Address.objects.values_list('name', 'id'))
+        report = {'rows': 0, 'updated': 0, 'skipped': 0}
+        batch = []
+        with open(options['path'], 'rb') as f, transaction.atomic():
+            for row in read_rows(f, options['path']):
+                report['rows'] += 1
+                try:
+                    address_id = addresses[row['address']]
+                    latitude = parse_number(row['latitude'], float)
+                    longitude = parse_number(row['longitude'], float)
+                except (KeyError, ValueError, InvalidOperation):
+                    latitude = longitude = None
+                if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+                    report['skipped'] += 1
+                    continue
+                batch.append(Address(id=address_id, latitude=latitude, longitude=longitude))
+                if len(batch) >= BATCH_SIZE:
+                    Address.objects.bulk_update(batch, ['latitude', 'longitude'])
+                    report['updated'] += len(batch)
+                    batch = []
+            Address.objects.bulk_update(batch, ['latitude', 'longitude'])
+            report['updated'] += len(batch)
+            transaction.on_commit(bump_geo_version)
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{k}={v}' for k, v in report.items())))
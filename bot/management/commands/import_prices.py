@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from bot.imports import import_price_list, COLUMNS
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV or XLSX price list into pharmacy stocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help=f'Price list with the columns {", ".join(COLUMNS)}')
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as f:
+            report = import_price_list(f, options['path'])
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{k}={v}' for k, v in report.items())))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from bot.models import PriceFeed
+from bot.feeds import sync_feed
+
+
+class Command(BaseCommand):
+    help = 'Sync pharmacy stocks with the changes of the active price feeds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feed', action='append', help='Name of the feed to sync, all active feeds by default')
+
+    def handle(self, *args, **options):
+        feeds = PriceFeed.objects.filter(is_active=True)
+        if options['feed']:
+            feeds = feeds.filter(name__in=options['feed'])
+        for feed in feeds:
+            report = sync_feed(feed)
+            if report is None:
+                self.stdout.write(f'{feed.name}: not modified')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{feed.name}: ' + ', '.join(f'{k}={v}' for k, v in report.items())))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_medication_name_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Name')),
+                ('url', models.CharField(help_text='http(s):// URL, file:// URL or path to a CSV or XLSX price list', max_length=500, verbose_name='URL')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is active')),
+                ('etag', models.CharField(blank=True, default='', editable=False, max_length=255)),
+                ('last_modified', models.CharField(blank=True, default='', editable=False, max_length=255)),
+                ('synced', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Synced')),
+            ],
+            options={
+                'verbose_name': 'Price feed',
+                'verbose_name_plural': 'Price feeds',
+            },
+        ),
+        migrations.AddField(
+            model_name='pharmacystock',
+            name='checksum',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunSQL(
+            "UPDATE bot_pharmacystock SET checksum = md5(price::text)",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_pricefeed_pharmacystock_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('changed', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Price history',
+                'verbose_name_plural': 'Price history',
+                'db_table': 'bot_pricehistory',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(
+            """
+            CREATE TABLE bot_pricehistory (
+                id bigserial,
+                pharmacy_id bigint NOT NULL,
+                medication_id bigint NOT NULL,
+                chain_id bigint NOT NULL,
+                district_id bigint NOT NULL,
+                price numeric(10, 2) NOT NULL,
+                changed timestamp with time zone NOT NULL,
+                PRIMARY KEY (id, changed)
+            ) PARTITION BY RANGE (changed);
+            CREATE INDEX bot_pricehistory_medication_changed
+                ON bot_pricehistory (medication_id, changed) INCLUDE (chain_id, district_id, price);
+            DO $$
+            DECLARE month date := date_trunc('month', now());
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE bot_pricehistory_%s PARTITION OF bot_pricehistory FOR VALUES FROM (%L) TO (%L)',
+                    to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month'
+                );
+            END $$;
+            INSERT INTO bot_pricehistory (pharmacy_id, medication_id, chain_id, district_id, price, changed)
+            SELECT stock.pharmacy_id, stock.medication_id, pharmacy.chain_id, pharmacy.district_id, stock.price, now()
+            FROM bot_pharmacystock stock JOIN bot_pharmacy pharmacy ON pharmacy.id = stock.pharmacy_id;
+            """,
+            "DROP TABLE bot_pricehistory",
+        ),
+    ]
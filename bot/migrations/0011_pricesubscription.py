@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_pricehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('threshold', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Threshold')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is active')),
+                ('notified', models.DateTimeField(blank=True, null=True, verbose_name='Notified')),
+                ('district', models.ForeignKey(blank=True, help_text='Empty for all districts', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_subscriptions', to='bot.district', verbose_name='District')),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_subscriptions', to='bot.medication', verbose_name='Medication')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_subscriptions', to='bot.user', verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Price subscription',
+                'verbose_name_plural': 'Price subscriptions',
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['medication', 'district'], name='pricesubscription_match')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_pricesubscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('text', models.TextField(help_text='HTML formatting is allowed', verbose_name='Text')),
+                ('status', models.CharField(choices=[('new', 'New'), ('running', 'Running'), ('paused', 'Paused'), ('finished', 'Finished')], default='new', editable=False, max_length=10, verbose_name='Status')),
+                ('last_user_id', models.BigIntegerField(default=0, editable=False, verbose_name='Last user ID')),
+                ('sent', models.IntegerField(default=0, editable=False, verbose_name='Sent')),
+                ('blocked', models.IntegerField(default=0, editable=False, verbose_name='Blocked')),
+                ('failed', models.IntegerField(default=0, editable=False, verbose_name='Failed')),
+                ('finished', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Finished')),
+            ],
+            options={
+                'verbose_name': 'Broadcast',
+                'verbose_name_plural': 'Broadcasts',
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:59
+
+import re
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+# Frozen copies of Medication.format_name and normalize as of this migration
+def format_name(name, dosage, units, quantity, form):
+    if dosage:
+        if dosage % 1 == 0:
+            dosage = int(dosage)
+    if dosage and units and quantity and form:
+        return f'{name}, {dosage} {units}, {quantity} {form}'
+    elif dosage and units and not quantity:
+        return f'{name}, {dosage} {units}'
+    elif not dosage and quantity and form:
+        return f'{name}, {quantity} {form}'
+    else:
+        return f'{name}'
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', text.lower().replace('ё', 'е')))
+
+
+def fill_display_names(apps, schema_editor):
+    Medication = apps.get_model('bot', 'Medication')
+    medications = []
+    for medication in Medication.objects.select_related('units', 'form').iterator():
+        # historical models have no __str__, so pass the names
+        medication.display_name = format_name(
+            medication.name, medication.dosage, medication.units and medication.units.name,
+            medication.quantity, medication.form and medication.form.name)
+        medication.search_key = normalize(medication.name)
+        medications.append(medication)
+    Medication.objects.bulk_update(medications, ['display_name', 'search_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_broadcast'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='medication',
+            name='medication_name_upper_trgm',
+        ),
+        migrations.RemoveIndex(
+            model_name='medication',
+            name='medication_name_trgm',
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='display_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=400, verbose_name='Display name'),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='search_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_display_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medication',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('search_key', name='gin_trgm_ops'), name='medication_search_key_trgm'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_medication_display_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Min price')),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Max price')),
+                ('pharmacy_count', models.IntegerField(verbose_name='Pharmacy count')),
+                ('pharmacy_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None, verbose_name='Pharmacies')),
+                ('chain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chain_offers', to='bot.chain', verbose_name='Chain')),
+                ('district', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chain_offers', to='bot.district', verbose_name='District')),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chain_offers', to='bot.medication', verbose_name='Medication')),
+            ],
+            options={
+                'verbose_name': 'Chain offer',
+                'verbose_name_plural': 'Chain offers',
+                'indexes': [models.Index(fields=['medication', 'district', 'min_price'], name='chainoffer_medication_price')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chainoffer',
+            constraint=models.UniqueConstraint(condition=models.Q(('district__isnull', False)), fields=('medication', 'district', 'chain'), name='unique_chainoffer_district'),
+        ),
+        migrations.AddConstraint(
+            model_name='chainoffer',
+            constraint=models.UniqueConstraint(condition=models.Q(('district__isnull', True)), fields=('medication', 'chain'), name='unique_chainoffer_all_districts'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO bot_chainoffer (medication_id, district_id, chain_id, min_price, max_price,
+                                        pharmacy_count, pharmacy_ids, created, updated)
+            SELECT stock.medication_id, pharmacy.district_id, pharmacy.chain_id, min(stock.price), max(stock.price),
+                   count(DISTINCT pharmacy.id), array_agg(DISTINCT pharmacy.id), now(), now()
+            FROM bot_pharmacystock stock
+            JOIN bot_pharmacy pharmacy ON pharmacy.id = stock.pharmacy_id
+            GROUP BY GROUPING SETS ((stock.medication_id, pharmacy.district_id, pharmacy.chain_id),
+                                    (stock.medication_id, pharmacy.chain_id))
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
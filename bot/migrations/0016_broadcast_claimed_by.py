@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0015_address_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+    ]
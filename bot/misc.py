@@ -1,34 +1,94 @@
-import requests
-import logging
+import json
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from bot.exception import ResponseException, TelegramException
+from django.core.cache import cache
+from django.db import connection
+from bot.sender import sender
+from bot.throttle import INTERACTIVE
 from math import ceil
 
 
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
 class Empty():
+    __slots__ = ()
+
     def __bool__(self):
         return False
 
-    def __getattr__(self, name):
-        return Empty()
+    def __getattribute__(self, name):
+        return EMPTY
 
     def __repr__(self):
         return 'False'
 
 
-class DotAccessibleDict(dict):
-    def __init__(self, dictionary):
-        for key, value in dictionary.items():
-            if key == 'from':
-                key = 'from_user'
-            if isinstance(value, dict):
-                self.__dict__[key] = DotAccessibleDict(value)
-            else:
-                self.__dict__[key] = value
-            self[key] = value
+EMPTY = Empty()
+
+
+class Update():
+    """Attribute access to a parsed Telegram object without copying it, `from` is exposed as `from_user`."""
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+
+    # not __getattr__, its fallback pays for a raised AttributeError on every field
+    def __getattribute__(self, name):
+        if name == 'from_user':
+            name = 'from'
+        value = _update_data(self).get(name, EMPTY)
+        if type(value) is dict:
+            return Update(value)
+        return value
+
+    def __bool__(self):
+        return bool(_update_data(self))
+
+    def __repr__(self):
+        return repr(_update_data(self))
+
+
+_update_data = Update._data.__get__
+
+
+def async_redis():
+    """New asyncio client of the django-redis cache database, one per event loop."""
+    location = settings.CACHES['default']['LOCATION']
+    # django-redis takes a list of servers with the primary first
+    if isinstance(location, (list, tuple)):
+        location = location[0]
+    return aioredis.Redis.from_url(location)
 
-    def __getattr__(self, name):
-        return Empty()
+
+def version(key):
+    """Current value of a version counter in the cache, starting at 1."""
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, 1)
+        value = cache.get(key)
+    return value
+
+
+async def aversion(key):
+    value = await cache.aget(key)
+    if value is None:
+        await cache.aadd(key, 1)
+        value = await cache.aget(key)
+    return value
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1)
+        return cache.incr(key)
 
 
 def batched(lst, num):
@@ -40,21 +100,47 @@ def batched(lst, num):
     return batch
 
 
-def send_message(method, **data):
-    url = f'https://api.telegram.org/bot{settings.TELEGRAM_TOKEN}/{method}'
-    if 'photo' in data:
-        file = data.pop('photo')
-        with open(file, 'rb') as f:
-            response = requests.post(url, data=data, files={'photo': f})
-    else:
-        response = requests.post(url, data=data)
-    if response.status_code == 200:
-        response_data = DotAccessibleDict(response.json())
-        if response_data.ok:
-            return response_data.result
-        else:
-            logging.error(f'user_id={data.get("chat_id")} {response_data}')
-            raise TelegramException(f'user_id={data.get("chat_id")} {response_data}')
-    else:
-        logging.error(f'user_id={data.get("chat_id")} status={response.status_code} {response.text}')
-        raise ResponseException(f'user_id={data.get("chat_id")} status={response.status_code} {response.text}')
+def release_connection():
+    # the thread waits on Telegram and the rate limiter next, the database connection is not needed meanwhile
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def send_message(method, priority=INTERACTIVE, **data):
+    release_connection()
+    result = sender.submit(method, data, priority).result()
+    return Update(result) if isinstance(result, dict) else result
+
+
+def send_payload(method, chat_id, payload, priority=INTERACTIVE):
+    """Send a pre-rendered JSON body (bytes without chat_id) to a chat."""
+    content = b'{"chat_id":%d,%s' % (chat_id, payload[1:])
+    release_connection()
+    result = sender.submit(method, {'chat_id': chat_id}, priority, content=content).result()
+    return Update(result) if isinstance(result, dict) else result
+
+
+def send_message_batch(calls, priority=INTERACTIVE):
+    """Send [(method, data), ...] concurrently, returns results or exceptions in the same order."""
+    release_connection()
+    futures = [sender.submit(method, data, priority) for method, data in calls]
+    results = []
+    for future in futures:
+        try:
+            result = future.result()
+            results.append(Update(result) if isinstance(result, dict) else result)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def reply(method, **data):
+    """Bot API call answering an update, sent back in the webhook response body without an outbound request."""
+    if isinstance(data.get('reply_markup'), str):
+        data['reply_markup'] = json.loads(data['reply_markup'])
+    return {'method': method, **data}
+
+
+async def delay(task, *args, **kwargs):
+    """Dispatch a Celery task from async code without blocking the event loop on the broker."""
+    return await sync_to_async(task.delay, thread_sensitive=False)(*args, **kwargs)
@@ -1,8 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.fields import ArrayField
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
+from hashlib import md5
+import re
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', text.lower().replace('ё', 'е')))
 
 
 class BaseModel(models.Model):
@@ -47,6 +56,8 @@ class Address(BaseModel):
         verbose_name = _('Address')
 
     name = models.CharField(_('Address'), max_length=100, unique=True)
+    latitude = models.FloatField(_('Latitude'), blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(_('Longitude'), blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
 
     def __str__(self):
         return self.name
@@ -99,7 +110,30 @@ class Pharmacy(BaseModel):
     objects = PharmacyManager()
 
 
-class MedicationManager(models.Manager):
+class MedicationQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if not Medication.DISPLAY_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        medication_ids = list(self.values_list('id', flat=True))
+        rows = super().update(**kwargs)
+        Medication.objects.filter(id__in=medication_ids).refresh_display_names()
+        return rows
+
+    def refresh_display_names(self):
+        """Recompute display_name and search_key of the medications, e.g. after a Unit or Form rename."""
+        medications = [
+            Medication(id=i, display_name=Medication.format_name(name, dosage, units, quantity, form), search_key=normalize(name))
+            for i, name, dosage, units, quantity, form in
+            self.values_list('id', 'name', 'dosage', 'units__name', 'quantity', 'form__name').iterator()
+        ]
+        Medication.objects.bulk_update(medications, ['display_name', 'search_key'], batch_size=1000)
+        if medications:
+            medication_ids = [i.id for i in medications]
+            transaction.on_commit(lambda: Medication.names_changed(medication_ids))
+        return len(medications)
+
+
+class MedicationManager(models.Manager.from_queryset(MedicationQuerySet)):
     def get_queryset(self):
         return super().get_queryset().select_related('units', 'form')
 
@@ -108,7 +142,8 @@ class Medication(BaseModel):
     class Meta:
         indexes = [
             models.Index(fields=['name']),
-            models.Index(fields=['name', 'dosage'])
+            models.Index(fields=['name', 'dosage']),
+            GinIndex(OpClass('search_key', name='gin_trgm_ops'), name='medication_search_key_trgm'),
         ]
         verbose_name_plural = _('Medications')
         verbose_name = _('Medication')
@@ -120,21 +155,44 @@ class Medication(BaseModel):
     quantity = models.IntegerField(verbose_name=_('Quantity in pack'), validators=[MinValueValidator(1), MaxValueValidator(10000)], blank=True, null=True)
     form = models.ForeignKey('Form', on_delete=models.PROTECT, related_name='medication', verbose_name=_('Form'), blank=True, null=True)
     description = models.TextField(verbose_name=_('Description'), blank=True, null=True)
+    display_name = models.CharField(max_length=400, verbose_name=_('Display name'), blank=True, default='', editable=False)
+    search_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+
+    # fields display_name is made of
+    DISPLAY_FIELDS = {'name', 'dosage', 'units', 'units_id', 'quantity', 'form', 'form_id'}
 
     def __str__(self):
-        if self.dosage:
-            if self.dosage % 1 == 0:
-                dosage = int(self.dosage)
-            else:
-                dosage = self.dosage
-        if self.dosage and self.units and self.quantity and self.form:
-            return f'{self.name}, {dosage} {self.units}, {self.quantity} {self.form}'
-        elif self.dosage and self.units and not self.quantity:
-            return f'{self.name}, {dosage} {self.units}'
-        elif not self.dosage and self.quantity and self.form:
-            return f'{self.name}, {self.quantity} {self.form}'
+        return self.display_name or self.format_name(self.name, self.dosage, self.units, self.quantity, self.form)
+
+    def save(self, *args, **kwargs):
+        self.display_name = self.format_name(self.name, self.dosage, self.units, self.quantity, self.form)
+        self.search_key = normalize(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.DISPLAY_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'display_name', 'search_key'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def names_changed(medication_ids):
+        # bulk updates skip the post_save signal that does the same for a single medication
+        from bot.index import publish
+        from bot.search import bump_catalog_version
+        bump_catalog_version()
+        publish(medications=medication_ids)
+
+    @staticmethod
+    def format_name(name, dosage, units, quantity, form):
+        if dosage:
+            if dosage % 1 == 0:
+                dosage = int(dosage)
+        if dosage and units and quantity and form:
+            return f'{name}, {dosage} {units}, {quantity} {form}'
+        elif dosage and units and not quantity:
+            return f'{name}, {dosage} {units}'
+        elif not dosage and quantity and form:
+            return f'{name}, {quantity} {form}'
         else:
-            return f'{self.name}'
+            return f'{name}'
 
     objects = MedicationManager()
 
@@ -177,10 +235,23 @@ class PharmacyStock(BaseModel):
     pharmacy = models.ForeignKey(Pharmacy, on_delete=models.PROTECT, related_name='stocks', verbose_name=_('Pharmacy'), null=True)
     medication = models.ForeignKey(Medication, on_delete=models.PROTECT, related_name='stocks', verbose_name=_('Medication'))
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Price'), validators=[MinValueValidator(Decimal('0.01'))])
+    checksum = models.CharField(max_length=32, blank=True, default='', editable=False)
 
     def __str__(self):
         return str(self.id)
 
+    @staticmethod
+    def make_checksum(price):
+        # the same as md5(price::text) of a numeric(10, 2) in Postgres
+        return md5(str(Decimal(price).quantize(Decimal('0.01'))).encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        checksum = self.make_checksum(self.price)
+        # the checksum loaded from the database tells whether the price really changed
+        self.price_changed = checksum != self.checksum
+        self.checksum = checksum
+        super().save(*args, **kwargs)
+
     objects = PharmacyStockManager()
 
 
@@ -198,3 +269,109 @@ class ProductOfTheDay(BaseModel):
         return str(self.id)
 
     objects = PharmacyStockManager()
+
+
+class PriceFeed(BaseModel):
+    class Meta:
+        verbose_name_plural = _('Price feeds')
+        verbose_name = _('Price feed')
+
+    name = models.CharField(_('Name'), max_length=100, unique=True)
+    url = models.CharField(_('URL'), max_length=500, help_text=_('http(s):// URL, file:// URL or path to a CSV or XLSX price list'))
+    is_active = models.BooleanField(_('Is active'), default=True)
+    etag = models.CharField(max_length=255, blank=True, default='', editable=False)
+    last_modified = models.CharField(max_length=255, blank=True, default='', editable=False)
+    synced = models.DateTimeField(_('Synced'), blank=True, null=True, editable=False)
+
+    def __str__(self):
+        return self.name
+
+
+class PriceHistory(models.Model):
+    """Append-only log of PharmacyStock prices, partitioned by month in migration 0010."""
+    class Meta:
+        managed = False
+        db_table = 'bot_pricehistory'
+        verbose_name_plural = _('Price history')
+        verbose_name = _('Price history')
+
+    pharmacy = models.ForeignKey(Pharmacy, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    medication = models.ForeignKey(Medication, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    chain = models.ForeignKey(Chain, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    district = models.ForeignKey(District, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    changed = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.id)
+
+
+class PriceSubscription(BaseModel):
+    class Meta:
+        verbose_name_plural = _('Price subscriptions')
+        verbose_name = _('Price subscription')
+        indexes = [
+            models.Index(fields=['medication', 'district'], condition=Q(is_active=True), name='pricesubscription_match'),
+        ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='price_subscriptions', verbose_name=_('User'))
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='price_subscriptions', verbose_name=_('Medication'))
+    district = models.ForeignKey(District, on_delete=models.CASCADE, related_name='price_subscriptions', verbose_name=_('District'), null=True, blank=True, help_text=_('Empty for all districts'))
+    threshold = models.DecimalField(_('Threshold'), max_digits=10, decimal_places=2)
+    is_active = models.BooleanField(_('Is active'), default=True)
+    notified = models.DateTimeField(_('Notified'), blank=True, null=True)
+
+    def __str__(self):
+        return str(self.id)
+
+
+class Broadcast(BaseModel):
+    class Meta:
+        verbose_name_plural = _('Broadcasts')
+        verbose_name = _('Broadcast')
+
+    NEW = 'new'
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    FINISHED = 'finished'
+    STATUS = [(NEW, _('New')), (RUNNING, _('Running')), (PAUSED, _('Paused')), (FINISHED, _('Finished'))]
+
+    text = models.TextField(_('Text'), help_text=_('HTML formatting is allowed'))
+    status = models.CharField(_('Status'), max_length=10, choices=STATUS, default=NEW, editable=False)
+    last_user_id = models.BigIntegerField(_('Last user ID'), default=0, editable=False)
+    # id of the task sending the chunk after last_user_id
+    claimed_by = models.CharField(max_length=255, blank=True, default='', editable=False)
+    sent = models.IntegerField(_('Sent'), default=0, editable=False)
+    blocked = models.IntegerField(_('Blocked'), default=0, editable=False)
+    failed = models.IntegerField(_('Failed'), default=0, editable=False)
+    finished = models.DateTimeField(_('Finished'), blank=True, null=True, editable=False)
+
+    def __str__(self):
+        return str(self.id)
+
+
+class ChainOffer(BaseModel):
+    """Cheapest and dearest price of a medication per chain and district, maintained by bot.offers."""
+    class Meta:
+        verbose_name_plural = _('Chain offers')
+        verbose_name = _('Chain offer')
+        indexes = [
+            models.Index(fields=['medication', 'district', 'min_price'], name='chainoffer_medication_price'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['medication', 'district', 'chain'], condition=Q(district__isnull=False),
+                                    name='unique_chainoffer_district'),
+            models.UniqueConstraint(fields=['medication', 'chain'], condition=Q(district__isnull=True),
+                                    name='unique_chainoffer_all_districts'),
+        ]
+
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='chain_offers', verbose_name=_('Medication'))
+    district = models.ForeignKey(District, on_delete=models.CASCADE, related_name='chain_offers', verbose_name=_('District'), null=True, blank=True)
+    chain = models.ForeignKey(Chain, on_delete=models.CASCADE, related_name='chain_offers', verbose_name=_('Chain'))
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Min price'))
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Max price'))
+    pharmacy_count = models.IntegerField(_('Pharmacy count'))
+    pharmacy_ids = ArrayField(models.BigIntegerField(), verbose_name=_('Pharmacies'))
+
+    def __str__(self):
+        return str(self.id)
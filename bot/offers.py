@@ -0,0 +1,57 @@
+import threading
+from django.db import connection, transaction
+from bot.search import bump_catalog_version
+
+
+# One row per (medication, district, chain) and per (medication, chain) for
+# all districts, the second grouping set leaves district_id NULL
+INSERT_OFFERS = '''
+    INSERT INTO bot_chainoffer (medication_id, district_id, chain_id, min_price, max_price,
+                                pharmacy_count, pharmacy_ids, created, updated)
+    SELECT stock.medication_id, pharmacy.district_id, pharmacy.chain_id, min(stock.price), max(stock.price),
+           count(DISTINCT pharmacy.id), array_agg(DISTINCT pharmacy.id), now(), now()
+    FROM bot_pharmacystock stock
+    JOIN bot_pharmacy pharmacy ON pharmacy.id = stock.pharmacy_id
+    {where}
+    GROUP BY GROUPING SETS ((stock.medication_id, pharmacy.district_id, pharmacy.chain_id),
+                            (stock.medication_id, pharmacy.chain_id))
+'''
+
+# Refreshes run one at a time, readers keep seeing the previous rows until commit
+LOCK_OFFERS = 'LOCK TABLE bot_chainoffer IN SHARE ROW EXCLUSIVE MODE'
+
+_local = threading.local()
+
+
+def refresh_offers(medication_ids=None):
+    """Recompute the ChainOffer rows of the given medications, or of all of them."""
+    if medication_ids is not None:
+        medication_ids = sorted(set(medication_ids))
+        if not medication_ids:
+            return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_OFFERS)
+        if medication_ids is None:
+            cursor.execute('DELETE FROM bot_chainoffer')
+            cursor.execute(INSERT_OFFERS.format(where=''))
+        else:
+            cursor.execute('DELETE FROM bot_chainoffer WHERE medication_id = ANY(%s)', [medication_ids])
+            cursor.execute(INSERT_OFFERS.format(where='WHERE stock.medication_id = ANY(%s)'), [medication_ids])
+
+
+def refresh_offers_on_commit(medication_ids):
+    """Refresh the offers of the medications after the transaction commits, once for all changes of the transaction."""
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = set()
+    # ids left by a rolled back transaction are refreshed with the next one, which is harmless
+    pending.update(medication_ids)
+    transaction.on_commit(flush_offers)
+
+
+def flush_offers():
+    medication_ids, _local.pending = getattr(_local, 'pending', None), None
+    if medication_ids:
+        refresh_offers(medication_ids)
+        # not before, a search in between would cache the old offers under the new version
+        bump_catalog_version()
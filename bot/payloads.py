@@ -0,0 +1,56 @@
+import json
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import F
+from django_redis import get_redis_connection
+from bot.misc import batched
+from bot.models import District, ProductOfTheDay
+from bot import texts
+
+
+PAYLOAD_KEY = 'payload:{}'
+# bounds the staleness after changes that skip the signals, like raw imports or QuerySet.update
+PAYLOAD_TIMEOUT = 3600
+
+
+def render_districts():
+    districts = [{'text': i.name, 'callback_data': f'district_{i.id}'} for i in District.objects.all()]
+    inline_keyboard = batched(districts, 2) or [[]]
+    inline_keyboard[-1].append({'text': texts.all_districts, 'callback_data': 'district_all'})
+    return {'parse_mode': 'HTML', 'text': texts.district, 'reply_markup': {'inline_keyboard': inline_keyboard}}
+
+
+def render_product_of_the_day():
+    products = list(ProductOfTheDay.objects
+                    .values('id', 'price', name=F('medication__display_name'),
+                            chain=F('pharmacy__chain__name'), address=F('pharmacy__address__name'))
+                    .annotate(phones=ArrayAgg('pharmacy__phone__number', distinct=True))
+                    .order_by('-price'))
+    if not products:
+        return {'parse_mode': 'HTML', 'text': texts.product_of_the_day_not_found}
+    text = ''
+    for product in products:
+        medication = f'💊 {product["name"]} 💵 <b>{product["price"]} грн.</b>\n'
+        pharmacy = f'🏥{product["chain"]} - {product["address"]}\n'
+        phones = ''.join(f'{phone}\n' for phone in product['phones'] if phone)
+        text += medication + pharmacy + phones + '\n'
+    return {'parse_mode': 'HTML', 'text': text}
+
+
+RENDERERS = {
+    'districts': render_districts,
+    'product_of_the_day': render_product_of_the_day,
+}
+
+
+def refresh_payload(name):
+    """Render a message once and store it as the JSON body of a Bot API call, chat_id excluded."""
+    payload = json.dumps(RENDERERS[name](), ensure_ascii=False).encode()
+    get_redis_connection('default').set(PAYLOAD_KEY.format(name), payload, ex=PAYLOAD_TIMEOUT)
+    return payload
+
+
+def get_payload(name):
+    payload = get_redis_connection('default').get(PAYLOAD_KEY.format(name))
+    if payload is None:
+        payload = refresh_payload(name)
+    return payload
@@ -0,0 +1,47 @@
+from hashlib import blake2b
+from django_redis import get_redis_connection
+from bot.session import SESSION_TIMEOUT
+
+
+RESULT_SET_KEY = 'resultset:{}'
+
+
+def encode(ids):
+    """Sorted ids as varint encoded deltas, a few bytes per id instead of a pickled list."""
+    data = bytearray()
+    previous = 0
+    for i in sorted(set(ids)):
+        delta, previous = i - previous, i
+        while delta >= 0x80:
+            data.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def decode(data):
+    ids = []
+    previous = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ids.append(previous)
+        value = shift = 0
+    return ids
+
+
+def store(ids):
+    """Store a set of ids once under a key derived from its content, returns the reference to keep in a session."""
+    data = encode(ids)
+    ref = blake2b(data, digest_size=12).hexdigest()
+    get_redis_connection('default').set(RESULT_SET_KEY.format(ref), data, ex=SESSION_TIMEOUT)
+    return ref
+
+
+def load(ref):
+    """Return the ids stored under a reference or None when it has expired."""
+    data = get_redis_connection('default').get(RESULT_SET_KEY.format(ref))
+    return None if data is None else decode(data)
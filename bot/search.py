@@ -0,0 +1,74 @@
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from bot.models import Medication, PharmacyStock, ChainOffer, normalize
+from bot.index import medication_index
+from bot.misc import version, aversion, bump_version
+
+
+SEARCH_LIMIT = 20
+CACHE_TIMEOUT = 3600
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def catalog_version():
+    return version(CATALOG_VERSION_KEY)
+
+
+async def acatalog_version():
+    return await aversion(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Invalidate every cached search result at once by moving to a new key namespace."""
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def search_queryset(query, district, limit=SEARCH_LIMIT):
+    """Ids of the best matching medications in stock in the district."""
+    query = normalize(query)
+    in_stock = PharmacyStock.objects.filter(medication=OuterRef('pk'))
+    if district != 'all':
+        in_stock = in_stock.filter(pharmacy__district_id=district)
+    medication_ids = (Medication.objects
+                      .filter(Q(search_key__contains=query) | Q(search_key__trigram_word_similar=query))
+                      .filter(Exists(in_stock))
+                      .annotate(similarity=TrigramWordSimilarity(query, 'search_key'))
+                      .order_by('-similarity', 'search_key')
+                      .values_list('id', flat=True)[:limit])
+    return medication_ids
+
+
+async def asearch_medications(query, district, limit=SEARCH_LIMIT):
+    return [i async for i in search_queryset(query, district, limit)]
+
+
+async def afind_medications(query, district, limit=SEARCH_LIMIT):
+    """Resolve a search from the in-memory index, the database is used only while the index is cold."""
+    medication_ids = medication_index.search(query, district, limit)
+    if medication_ids is not None:
+        return medication_ids
+    key = f'search:{await acatalog_version()}:{district}:{limit}:{normalize(query)}'
+    medication_ids = await cache.aget(key)
+    if medication_ids is None:
+        medication_ids = await asearch_medications(query, district, limit)
+        await cache.aset(key, medication_ids, timeout=CACHE_TIMEOUT)
+    return medication_ids
+
+
+def get_offers(medication_id, district):
+    """Return the cheapest offer of every chain and the ids of the pharmacies having the medication."""
+    key = f'offers:{catalog_version()}:{medication_id}:{district}'
+    offers = cache.get(key)
+    if offers is not None:
+        return offers
+    chains = (ChainOffer.objects
+              .filter(medication_id=medication_id, district_id=None if district == 'all' else district)
+              .order_by('min_price', 'chain__name')
+              .values_list('chain_id', 'chain__name', 'min_price', 'pharmacy_ids'))
+    offers = {'chains': [], 'pharmacy_ids': []}
+    for chain_id, chain, price, pharmacy_ids in chains:
+        offers['chains'].append({'chain_id': chain_id, 'chain': chain, 'price': price})
+        offers['pharmacy_ids'] += pharmacy_ids
+    cache.set(key, offers, timeout=CACHE_TIMEOUT)
+    return offers
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import httpx
+from django.conf import settings
+from bot.exception import ResponseException, TelegramException
+from bot.throttle import RateLimiter, INTERACTIVE
+
+
+class TelegramSender:
+    """Bot API client running on an asyncio loop in a background thread."""
+
+    def __init__(self, connections, timeout):
+        self.connections = connections
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self.limiter = RateLimiter()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._client = None
+                self.limiter.reset()
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name='telegram-sender', daemon=True).start()
+            return self._loop
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f'https://api.telegram.org/bot{settings.TELEGRAM_TOKEN}/',
+                limits=httpx.Limits(max_connections=self.connections, max_keepalive_connections=self.connections),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    async def request(self, method, data, priority=INTERACTIVE, content=None):
+        data = {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in data.items()}
+        files = None
+        if 'photo' in data:
+            with open(data.pop('photo'), 'rb') as f:
+                files = {'photo': f.read()}
+        for _ in range(settings.TELEGRAM_SENDER_RETRIES):
+            await self.limiter.acquire(data.get('chat_id'), priority)
+            if content is not None:
+                response = await self.client.post(method, content=content, headers={'Content-Type': 'application/json'})
+            else:
+                response = await self.client.post(method, data=data, files=files)
+            if response.status_code != 429:
+                break
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            logging.warning(f'user_id={data.get("chat_id")} too many requests, retry after {retry_after}s')
+            await self.limiter.pause(retry_after)
+        if response.status_code == 200:
+            response_data = response.json()
+            if response_data.get('ok'):
+                return response_data.get('result')
+            else:
+                logging.error(f'user_id={data.get("chat_id")} {response_data}')
+                raise TelegramException(f'user_id={data.get("chat_id")} {response_data}',
+                                        status=response_data.get('error_code'))
+        else:
+            logging.error(f'user_id={data.get("chat_id")} status={response.status_code} {response.text}')
+            raise ResponseException(f'user_id={data.get("chat_id")} status={response.status_code} {response.text}',
+                                    status=response.status_code)
+
+    def submit(self, method, data, priority=INTERACTIVE, content=None):
+        return asyncio.run_coroutine_threadsafe(self.request(method, data, priority, content), self.loop)
+
+
+sender = TelegramSender(settings.TELEGRAM_SENDER_CONNECTIONS, settings.TELEGRAM_SENDER_TIMEOUT)
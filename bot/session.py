@@ -0,0 +1,68 @@
+import json
+from django_redis import get_redis_connection
+from bot.misc import loads, async_redis
+
+
+SESSION_KEY = 'session:{}'
+SESSION_TIMEOUT = 3600
+
+_redis = None
+
+
+def get_async_redis():
+    global _redis
+    if _redis is None:
+        _redis = async_redis()
+    return _redis
+
+
+class UserSession:
+    """State of a user between updates, kept in one Redis hash."""
+    # fields: district, buttons ({label: medication id}), result (bot.resultsets reference), medication, basket
+
+    def __init__(self, user_id, data=None):
+        self.user_id = user_id
+        self.key = SESSION_KEY.format(user_id)
+        self._data = data or {}
+        self._decoded = {}
+
+    def __getitem__(self, field):
+        if field not in self._decoded:
+            value = self._data.get(field.encode())
+            self._decoded[field] = None if value is None else loads(value)
+        return self._decoded[field]
+
+    def get(self, field, default=None):
+        value = self[field]
+        return default if value is None else value
+
+    @property
+    def district(self):
+        return self['district']
+
+    @classmethod
+    def load(cls, user_id):
+        return cls(user_id, get_redis_connection('default').hgetall(SESSION_KEY.format(user_id)))
+
+    @classmethod
+    async def aload(cls, user_id):
+        return cls(user_id, await get_async_redis().hgetall(SESSION_KEY.format(user_id)))
+
+    def _write(self, pipeline, fields, delete):
+        if fields:
+            pipeline.hset(self.key, mapping={k: json.dumps(v) for k, v in fields.items()})
+        if delete:
+            pipeline.hdel(self.key, *delete)
+        pipeline.expire(self.key, SESSION_TIMEOUT)
+        self._decoded.update(fields)
+        self._decoded.update(dict.fromkeys(delete))
+
+    def update(self, delete=(), **fields):
+        pipeline = get_redis_connection('default').pipeline(transaction=True)
+        self._write(pipeline, fields, delete)
+        pipeline.execute()
+
+    async def aupdate(self, delete=(), **fields):
+        pipeline = get_async_redis().pipeline(transaction=True)
+        self._write(pipeline, fields, delete)
+        await pipeline.execute()
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from bot.models import Medication, PharmacyStock, Pharmacy, Chain, Unit, Form, District, \
+    ProductOfTheDay, Address, Phone
+from bot.index import publish
+from bot.search import bump_catalog_version
+from bot.payloads import refresh_payload
+from bot import history
+from bot.offers import refresh_offers_on_commit
+from bot.geo import bump_geo_version
+
+
+# stock and pharmacy changes bump the version in flush_offers, once the offers are rebuilt
+@receiver([post_save, post_delete], sender=Medication)
+@receiver([post_save, post_delete], sender=Chain)
+def bump_version(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Medication)
+def medication_changed(sender, instance, **kwargs):
+    # read now, a delete sets the pk to None before the transaction commits
+    medication_id = instance.id
+    transaction.on_commit(lambda: publish(medications=[medication_id]))
+
+
+@receiver([post_save, post_delete], sender=PharmacyStock)
+def pharmacy_stock_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: publish(medications=[instance.medication_id]))
+
+
+@receiver([post_save, post_delete], sender=PharmacyStock)
+def pharmacy_stock_offers_changed(sender, instance, **kwargs):
+    refresh_offers_on_commit([instance.medication_id])
+
+
+@receiver(post_save, sender=PharmacyStock)
+def pharmacy_stock_price_changed(sender, instance, created, **kwargs):
+    if created or getattr(instance, 'price_changed', False):
+        history.record(instance.pharmacy_id, instance.medication_id, instance.price)
+
+
+@receiver(post_save, sender=Pharmacy)
+def pharmacy_changed(sender, instance, **kwargs):
+    medication_ids = list(instance.stocks.values_list('medication_id', flat=True))
+    if medication_ids:
+        refresh_offers_on_commit(medication_ids)
+        transaction.on_commit(lambda: publish(medications=medication_ids))
+
+
+@receiver(post_save, sender=Unit)
+def unit_changed(sender, instance, **kwargs):
+    Medication.objects.filter(units=instance).refresh_display_names()
+
+
+@receiver(post_save, sender=Form)
+def form_changed(sender, instance, **kwargs):
+    Medication.objects.filter(form=instance).refresh_display_names()
+
+
+@receiver([post_save, post_delete], sender=Unit)
+@receiver([post_save, post_delete], sender=Form)
+def catalog_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: publish(reload=True))
+
+
+@receiver([post_save, post_delete], sender=Address)
+@receiver([post_save, post_delete], sender=Pharmacy)
+def location_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_geo_version)
+
+
+@receiver([post_save, post_delete], sender=District)
+def district_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: refresh_payload('districts'))
+
+
+@receiver([post_save, post_delete], sender=ProductOfTheDay)
+@receiver([post_save, post_delete], sender=Medication)
+@receiver([post_save, post_delete], sender=Pharmacy)
+@receiver([post_save, post_delete], sender=Chain)
+@receiver([post_save, post_delete], sender=Address)
+@receiver([post_save, post_delete], sender=Phone)
+@receiver([post_save, post_delete], sender=Unit)
+@receiver([post_save, post_delete], sender=Form)
+@receiver(m2m_changed, sender=Pharmacy.phone.through)
+def product_of_the_day_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: refresh_payload('product_of_the_day'))
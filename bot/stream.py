@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from redis.exceptions import ResponseError
+from django.conf import settings
+from bot.sender import sender
+from bot.misc import loads, async_redis
+from bot.handlers import handle_update
+
+
+GROUP = 'bot'
+STREAM_KEY = 'telegram:updates:{}'
+DEDUP_KEY = 'telegram:update:{}'
+DEDUP_TIMEOUT = 86400
+
+# Append the update only if its update_id has not been seen yet
+INGEST_SCRIPT = '''
+if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'body', ARGV[3])
+end
+return false
+'''
+
+# Updates of different users processed at once by a shard
+CONSUMER_CONCURRENCY = 100
+
+_redis = None
+_ingest_script = None
+
+
+def get_redis():
+    global _redis, _ingest_script
+    if _redis is None:
+        _redis = async_redis()
+        _ingest_script = _redis.register_script(INGEST_SCRIPT)
+    return _redis
+
+
+def get_user_id(update):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from'].get('id', 0)
+    return 0
+
+
+async def ingest(raw):
+    """Dedupe on update_id and append the raw update to the stream of its user."""
+    update = loads(raw)
+    shard = get_user_id(update) % settings.TELEGRAM_STREAM_SHARDS
+    get_redis()
+    await _ingest_script(
+        keys=[DEDUP_KEY.format(update['update_id']), STREAM_KEY.format(shard)],
+        args=[DEDUP_TIMEOUT, settings.TELEGRAM_STREAM_MAXLEN, raw],
+    )
+
+
+async def process(previous, stream, message_id, update):
+    # updates of a user are handled in order, other users of the shard do not wait for them
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        response = await handle_update(update)
+        if response:
+            method = response.pop('method')
+            await asyncio.wrap_future(sender.submit(method, response))
+    except Exception as e:
+        logging.exception(e)
+    await get_redis().xack(stream, GROUP, message_id)
+
+
+async def consume_shard(shard, consumer):
+    redis = get_redis()
+    stream = STREAM_KEY.format(shard)
+    try:
+        await redis.xgroup_create(stream, GROUP, id='0', mkstream=True)
+    except ResponseError:
+        pass
+    users = {}
+    slots = asyncio.Semaphore(CONSUMER_CONCURRENCY)
+    # entries delivered before a crash and never acknowledged go first
+    last_id = '0'
+    while True:
+        entries = await redis.xreadgroup(GROUP, consumer, {stream: last_id}, count=100, block=5000)
+        if last_id != '>' and not (entries and entries[0][1]):
+            last_id = '>'
+            continue
+        for _, messages in entries:
+            for message_id, fields in messages:
+                update = loads(fields[b'body'])
+                user_id = get_user_id(update)
+                await slots.acquire()
+                task = asyncio.create_task(process(users.get(user_id), stream, message_id, update))
+                users[user_id] = task
+                task.add_done_callback(lambda task, user_id=user_id: done(users, slots, user_id, task))
+                if last_id != '>':
+                    # the pending entries are read again after the last one taken
+                    last_id = message_id
+            await sync_to_async(close_old_connections)()
+
+
+def done(users, slots, user_id, task):
+    slots.release()
+    if users.get(user_id) is task:
+        del users[user_id]
+
+
+async def consume(shards, consumer):
+    await asyncio.gather(*[consume_shard(i, consumer) for i in shards])
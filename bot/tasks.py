@@ -1,75 +1,113 @@
 import logging
 import json
+from math import ceil
 from celery.utils.log import get_task_logger
 from app.celery import app
-from django.db.models.functions import Concat, Cast
-from django.db.models import CharField, Value, F, Q
-from django.core.cache import cache
-from bot.misc import send_message, batched
+from django.db.models import F, Q
+from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.contrib.postgres.aggregates import ArrayAgg
+from bot.misc import send_message, send_payload, send_message_batch, batched
 from bot import texts
-from bot.models import PharmacyStock, District, ProductOfTheDay, Medication
+from bot.exception import BotException
+from bot.models import PharmacyStock, Medication, PriceSubscription, User, Broadcast, PriceFeed, Pharmacy, Chain
+from bot.index import medication_labels
+from bot.search import get_offers, bump_catalog_version
+from bot.payloads import get_payload
+from bot.alerts import match_price_drops
+from bot.throttle import BULK
+from bot.session import UserSession
+from bot.offers import refresh_offers
+from bot.basket import optimize
+from bot.geo import pharmacy_locator
+from bot import resultsets
+from bot.feeds import sync_feed
+from bot.imports import import_price_list
 
 
 logger = get_task_logger(__name__)
 logger.setLevel(logging.INFO)
-CACHE_TIMEOUT = 3600
+SEARCH_RESULT_PAGE_SIZE = 5
+NEAREST_PHARMACIES = 5
+NOTIFICATION_BATCH_SIZE = 100
+BROADCAST_CHUNK_SIZE = 100
 
 # from django.db import connection
 # print(connection.queries.__len__())
 
+def main_keyboard():
+    return [[
+        {'text': texts.search_by_medication_button},
+        {'text': texts.product_of_the_day_button}
+    ], [
+        {'text': texts.basket_button},
+        {'text': texts.nearest_button, 'request_location': True}
+    ]]
+
+
 keyboard_first = json.dumps(
     {
-        'keyboard': [[
-            {'text': texts.search_by_medication_button},
-            {'text': texts.product_of_the_day_button}
-        ]],
+        'keyboard': main_keyboard(),
         'resize_keyboard': True
     }
 )
 
 
-@app.task()
-def send_message_the_first(id, start=True):
+def the_first_message(id, start=True):
     if start:
         text = texts.start_message
     else:
         text = texts.before_search_button
-    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text, reply_markup=keyboard_first)
+    return dict(chat_id=id, parse_mode='HTML', text=text, reply_markup=keyboard_first)
+
+
+def not_found_message(id):
+    return dict(chat_id=id, parse_mode='HTML', text=texts.not_found)
+
+
+def before_searching_message(id):
+    return dict(chat_id=id, parse_mode='HTML', text=texts.search_message)
+
+
+@app.task()
+def send_message_the_first(id, start=True):
+    send_message('sendMessage', **the_first_message(id, start))
     logger.info(f'Send the first message to {id=} successfully')
 
 
 @app.task()
 def send_message_districts(id):
-    districts = District.objects.annotate(
-        text=F('name'),
-        callback_data=Concat(
-            Value('district_'),
-            Cast(F('id'), output_field=CharField()),
-        )
-    ).values('text', 'callback_data')
-    inline_keyboard = batched(districts, 2)
-    inline_keyboard[-1].append({'text': texts.all_districts, 'callback_data': 'district_all'})
-    reply_markup = json.dumps({'inline_keyboard': inline_keyboard})
-    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.district, reply_markup=reply_markup)
+    send_payload('sendMessage', id, get_payload('districts'))
     logger.info(f'Send message about districts to {id=} successfully')
 
 
 @app.task()
 def send_message_not_found(id):
-    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.not_found)
+    send_message('sendMessage', **not_found_message(id))
     logger.info(f'Send message not found to {id=} successfully')
 
 
 @app.task()
 def send_message_before_searching(id):
-    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.search_message)
+    send_message('sendMessage', **before_searching_message(id))
     logger.info(f'Send message before searching to {id=} successfully')
 
 
 @app.task()
 def send_message_medication_buttons(id, medication_ids):
-    medications = Medication.objects.filter(id__in=medication_ids).all()
-    keyboard = batched([dict(text=f'💊 {str(i)}⠀') for i in medications], 1)  # after str(i) is a zero width space U2800
+    labels = medication_labels(medication_ids)
+    buttons = {}
+    for medication_id in medication_ids:
+        if medication_id not in labels:
+            continue
+        label, n = labels[medication_id], 1
+        while label in buttons:
+            n += 1
+            label = f'{labels[medication_id]} ({n})'
+        buttons[label] = medication_id
+    UserSession(id).update(buttons=buttons)
+    keyboard = batched([dict(text=f'💊 {i}⠀') for i in buttons], 1)  # after label is a zero width space U2800
+    keyboard += main_keyboard()
     reply_markup = json.dumps(
         {
             'keyboard': keyboard,
@@ -82,81 +120,230 @@ def send_message_medication_buttons(id, medication_ids):
 
 
 @app.task()
-def send_message_search_result(id, medication_full_name):
-    district = cache.get(f'{id}_district')
+def send_message_search_result(id, medication_id, page=1, message_id=None, district=None):
+    district = district or UserSession.load(id).district
     if not district:
         logger.info(f'Cache for {id=} is empty')
         return
-    medications = (Medication.objects.annotate(medication_full_name=Value(medication_full_name, output_field=CharField()))
-                   .filter(medication_full_name__icontains=F('name')).all())
-    medication = list(filter(lambda x: str(x) == medication_full_name, medications))[0]
-    if district == 'all':
-        where = Q(medication=medication)
+    medication = Medication.objects.values('id', 'display_name').get(id=medication_id)
+    offers = get_offers(medication['id'], district)
+    if not message_id:
+        UserSession(id).update(result=resultsets.store(offers['pharmacy_ids']), medication=medication_id)
+    pages = max(ceil(len(offers['chains']) / SEARCH_RESULT_PAGE_SIZE), 1)
+    page = min(max(page, 1), pages)
+    chains = offers['chains'][(page - 1) * SEARCH_RESULT_PAGE_SIZE:page * SEARCH_RESULT_PAGE_SIZE]
+    text = f'💊 <b>{medication["display_name"]}</b>\n\n'
+    for offer in chains:
+        text += f'🏥 {offer["chain"]} 💵 <b>{offer["price"]} грн.</b>\n'
+    if pages > 1:
+        text += f'\n{texts.page} {page}/{pages}\n'
+    text += f'\n{texts.after_search_message}'
+    inline_keyboard = [[{'text': f'{texts.in_detail_text}: {i["chain"]}', 'callback_data': f'chain_{i["chain_id"]}'}] for i in chains]
+    navigation = []
+    if page > 1:
+        navigation.append({'text': texts.previous_page, 'callback_data': f'page_{medication["id"]}_{page - 1}'})
+    if page < pages:
+        navigation.append({'text': texts.next_page, 'callback_data': f'page_{medication["id"]}_{page + 1}'})
+    if navigation:
+        inline_keyboard.append(navigation)
+    if chains:
+        inline_keyboard.append([{'text': texts.subscribe_button, 'callback_data': f'subscribe_{medication["id"]}'}])
+        inline_keyboard.append([{'text': texts.add_to_basket_button, 'callback_data': f'basket_add_{medication["id"]}'}])
+    reply_markup = json.dumps({'inline_keyboard': inline_keyboard})
+    if message_id:
+        try:
+            send_message('editMessageText', chat_id=id, message_id=message_id, parse_mode='HTML', text=text, reply_markup=reply_markup)
+        except BotException as e:
+            # the button of the page already shown was pressed
+            if e.status != 400 or 'message is not modified' not in str(e):
+                raise
+            logger.info(f'Search result page {page} of {id=} not modified')
+            return
     else:
-        where = Q(medication=medication) & Q(pharmacy__district_id=district)
-    stocks = PharmacyStock.objects.select_related('pharmacy__chain').filter(where).distinct('pharmacy__chain__name')
-    stocks = sorted(stocks, key=lambda x: x.price, reverse=True)
-    stocks_ids = list(PharmacyStock.objects.filter(where).values_list('id', flat=True).all())
-    cache.set(id, stocks_ids, timeout=CACHE_TIMEOUT)
-    for stock in stocks:
-        text = f'🏥 {stock.pharmacy.chain.name} 💊 {medication} 💵 <b>{stock.price} грн.</b>\n\n'
-        inline_keyboard = json.dumps({'inline_keyboard': [[{'text': texts.in_detail_text, 'callback_data': f'chain_{stock.pharmacy.chain.id}'}]]})
-        send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text, reply_markup=inline_keyboard)
-        logger.info(f'Send message search result to {id=} successfully')
-    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.after_search_message, reply_markup=keyboard_first)
+        send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text, reply_markup=reply_markup)
+    logger.info(f'Send message search result page {page} to {id=} successfully')
 
 
 @app.task()
-def send_message_pharmacy_address(id, chain_id):
-    stocks_ids = cache.get(id)
-    district = cache.get(f'{id}_district')
-    if not stocks_ids or not district:
+def subscribe_price_drop(id, medication_id, district=None):
+    district = district or UserSession.load(id).district
+    if not district:
         logger.info(f'Cache for {id=} is empty')
         return
-    if district == 'all':
-        where = Q(Q(id__in=stocks_ids) & Q(pharmacy__chain_id=chain_id))
-    else:
-        where = Q(Q(id__in=stocks_ids) & Q(pharmacy__chain_id=chain_id) & Q(pharmacy__district_id=district))
-    stocks = list(PharmacyStock.objects
-                  .select_related('pharmacy__chain', 'pharmacy__address', 'pharmacy__district')
-                  .prefetch_related('pharmacy__phone')
-                  .filter(where)
-                  .all())
-    text = f'<b>🏥 {stocks[0].pharmacy.chain.name}</b>\n\n'
+    offers = get_offers(medication_id, district)
+    if not offers['chains']:
+        return
+    price = offers['chains'][0]['price']
+    PriceSubscription.objects.update_or_create(
+        user_id=id, medication_id=medication_id, district_id=None if district == 'all' else district,
+        defaults=dict(threshold=price, is_active=True, notified=None),
+    )
+    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.subscribed.format(price=price))
+    logger.info(f'Subscribe {id=} to price drops of medication {medication_id} below {price}')
+
+
+@app.task(acks_late=True)
+def notify_price_drops(changes):
+    """Notify the subscribers of the changed (medication_id, district_id) pairs, one message per user."""
+    matches = match_price_drops(changes)
+    if not matches:
+        return
+    medication_ids = list({medication_id for i in matches.values() for medication_id, _ in i})
+    labels = medication_labels(medication_ids)
+    calls = []
+    for user_id, drops in matches.items():
+        text = f'{texts.price_drops}\n\n'
+        for medication_id, price in drops:
+            text += f'💊 <b>{labels.get(medication_id, "")}</b> 💵 <b>{price} грн.</b>\n'
+        calls.append(('sendMessage', dict(chat_id=user_id, parse_mode='HTML', text=text)))
+    for batch in batched(calls, NOTIFICATION_BATCH_SIZE):
+        send_message_batch(batch, priority=BULK)
+    logger.info(f'Send price drop notifications to {len(calls)} users')
+
+
+@app.task()
+def send_message_pharmacy_address(id, chain_id, district=None, result=None):
+    if not district or not result:
+        session = UserSession.load(id)
+        district, result = session.district, session['result']
+    pharmacy_ids = resultsets.load(result) if result else None
+    if not pharmacy_ids or not district:
+        logger.info(f'Cache for {id=} is empty')
+        return
+    pharmacies = list(Pharmacy.objects
+                      .filter(id__in=pharmacy_ids, chain_id=chain_id)
+                      .values('id', chain_name=F('chain__name'), district_name=F('district__name'),
+                              address_name=F('address__name'))
+                      .annotate(phones=ArrayAgg('phone__number', distinct=True))
+                      .order_by('address_name'))
+    if not pharmacies:
+        logger.info(f'Pharmacies of chain {chain_id} for {id=} not found')
+        return
+    text = f'<b>🏥 {pharmacies[0]["chain_name"]}</b>\n\n'
     if district != 'all':
-        text += f'{stocks[0].pharmacy.district.name}:\n'
-    for stock in stocks:
-        text += f'{stock.pharmacy.address.name}\n'
-        phones = ''
-        if stock.pharmacy.phone.exists():
-            for phone in stock.pharmacy.phone.all():
-                phones += f'{phone.number}\n'
-        text += phones
+        text += f'{pharmacies[0]["district_name"]}:\n'
+    for pharmacy in pharmacies:
+        text += f'{pharmacy["address_name"]}\n'
+        text += ''.join(f'{phone}\n' for phone in pharmacy['phones'] if phone)
     send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text)
     logger.info(f'Send message addresses of pharmacies to {id=} successfully')
 
 
+@app.task()
+def send_message_basket(id, basket, district):
+    labels = medication_labels(basket)
+    result = optimize(basket, district)
+    pharmacy_ids = [result['pharmacy']['pharmacy_id']] if result['pharmacy'] else []
+    if result['split']:
+        pharmacy_ids += result['split']['pharmacy_ids']
+    pharmacies = {i: f'{chain} - {address}' for i, chain, address in
+                  Pharmacy.objects.filter(id__in=pharmacy_ids).values_list('id', 'chain__name', 'address__name')}
+    text = f'{texts.basket}\n\n'
+    text += ''.join(f'💊 {labels.get(i, "")}\n' for i in basket)
+    if result['pharmacy']:
+        text += f'\n{texts.basket_pharmacy}:\n{pharmacies[result["pharmacy"]["pharmacy_id"]]} 💵 <b>{result["pharmacy"]["total"]:.2f} грн.</b>\n'
+    if result['chain']:
+        chain = Chain.objects.values_list('name', flat=True).get(id=result['chain']['chain_id'])
+        text += f'\n{texts.basket_chain}:\n{chain} 💵 <b>{result["chain"]["total"]:.2f} грн.</b>\n'
+    if result['split']:
+        text += f'\n{texts.basket_split} 💵 <b>{result["split"]["total"]:.2f} грн.</b>:\n'
+        for pharmacy_id, medication_ids in zip(result['split']['pharmacy_ids'], result['split']['medication_ids']):
+            text += f'🏥 {pharmacies[pharmacy_id]}: {", ".join(labels.get(i, "") for i in medication_ids)}\n'
+    if not result['pharmacy'] and not result['split']:
+        text += f'\n{texts.basket_not_available}\n'
+    reply_markup = json.dumps({'inline_keyboard': [[{'text': texts.clear_basket_button, 'callback_data': 'basket_clear'}]]})
+    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text, reply_markup=reply_markup)
+    logger.info(f'Send message basket of {len(basket)} medications to {id=} successfully')
+
+
+@app.task()
+def send_message_nearest_pharmacies(id, medication_id, latitude, longitude):
+    prices = dict(PharmacyStock.objects
+                  .filter(medication_id=medication_id, pharmacy__isnull=False)
+                  .values_list('pharmacy_id', 'price'))
+    nearest = pharmacy_locator.nearest(latitude, longitude, NEAREST_PHARMACIES, prices)
+    if not nearest:
+        send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.nearest_not_found)
+        return
+    pharmacies = {i: (chain, address) for i, chain, address in
+                  Pharmacy.objects.filter(id__in=[i for _, i in nearest]).values_list('id', 'chain__name', 'address__name')}
+    medication = Medication.objects.values_list('display_name', flat=True).get(id=medication_id)
+    text = f'{texts.nearest} 💊 <b>{medication}</b>:\n\n'
+    for distance, pharmacy_id in nearest:
+        chain, address = pharmacies[pharmacy_id]
+        text += f'🏥 {chain} - {address}\n💵 <b>{prices[pharmacy_id]} грн.</b> 📍 {distance:.1f} км\n\n'
+    send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text)
+    logger.info(f'Send message nearest pharmacies with medication {medication_id} to {id=} successfully')
+
+
 @app.task()
 def send_message_product_of_the_day(id):
-    products = (ProductOfTheDay.objects
-                .select_related('medication', 'medication__form', 'medication__units',
-                                'pharmacy__chain', 'pharmacy__address')
-                .prefetch_related('pharmacy__phone')
-                .order_by('-price')
-                .all())
-    if not products:
-        send_message('sendMessage', chat_id=id, parse_mode='HTML', text=texts.product_of_the_day_not_found)
-        logger.info(f'Send message product of the day not found to {id=} successfully')
+    send_payload('sendMessage', id, get_payload('product_of_the_day'))
+    logger.info(f'Send message product of the day to {id=} successfully')
+
+
+@app.task(bind=True, acks_late=True)
+def send_broadcast(self, broadcast_id):
+    """Send the chunk after the last_user_id checkpoint and enqueue the task for the next one."""
+    broadcast = Broadcast.objects.filter(id=broadcast_id, status=Broadcast.RUNNING).first()
+    if not broadcast:
+        return
+    user_ids = list(User.objects
+                    .filter(id__gt=broadcast.last_user_id, is_deleted=False, is_bot=False)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:BROADCAST_CHUNK_SIZE])
+    if not user_ids:
+        Broadcast.objects.filter(id=broadcast_id, status=Broadcast.RUNNING).update(status=Broadcast.FINISHED, finished=timezone.now())
+        logger.info(f'Broadcast {broadcast_id} finished')
+        return
+    # a redelivered task keeps its id and sends its chunk again, a second chain of the broadcast stops here
+    claimed = (Broadcast.objects
+               .filter(id=broadcast_id, status=Broadcast.RUNNING, last_user_id=broadcast.last_user_id)
+               .filter(Q(claimed_by='') | Q(claimed_by=self.request.id))
+               .update(claimed_by=self.request.id))
+    if not claimed:
         return
-    if products:
-        text = ''
-        for product in products:
-            medication = f'💊 {product.medication} 💵 <b>{product.price} грн.</b>\n'
-            pharmacy = f'🏥{product.pharmacy}\n'
-            phones = ''
-            if product.pharmacy.phone.exists():
-                for phone in product.pharmacy.phone.all():
-                    phones += f'{phone.number}\n'
-            text += medication + pharmacy + phones + '\n'
-        send_message('sendMessage', chat_id=id, parse_mode='HTML', text=text)
-        logger.info(f'Send message product of the day to {id=} successfully')
+    calls = [('sendMessage', dict(chat_id=i, parse_mode='HTML', text=broadcast.text)) for i in user_ids]
+    results = send_message_batch(calls, priority=BULK)
+    blocked = [i for i, result in zip(user_ids, results) if isinstance(result, Exception) and getattr(result, 'status', None) == 403]
+    failed = sum(isinstance(i, Exception) for i in results) - len(blocked)
+    if blocked:
+        User.objects.filter(id__in=blocked).update(is_deleted=True)
+    Broadcast.objects.filter(id=broadcast_id, claimed_by=self.request.id).update(
+        last_user_id=user_ids[-1], claimed_by='',
+        sent=F('sent') + len(user_ids) - len(blocked) - failed, blocked=F('blocked') + len(blocked), failed=F('failed') + failed
+    )
+    logger.info(f'Broadcast {broadcast_id} sent to users {user_ids[0]}..{user_ids[-1]}, {len(blocked)} blocked, {failed} failed')
+    send_broadcast.delay(broadcast_id)
+
+
+@app.task()
+def sync_price_feed(feed_id):
+    feed = PriceFeed.objects.filter(id=feed_id, is_active=True).first()
+    if not feed:
+        return
+    report = sync_feed(feed)
+    if report is None:
+        logger.info(f'Price feed {feed.name} not modified')
+    else:
+        logger.info(f'Price feed {feed.name} synced: ' + ', '.join(f'{k}={v}' for k, v in report.items()))
+
+
+@app.task()
+def import_uploaded_price_list(path, name):
+    try:
+        with default_storage.open(path, 'rb') as file:
+            report = import_price_list(file.file, name)
+    except ValueError as e:
+        logger.error(f'Price list {name} not imported: {e}')
+        return
+    finally:
+        default_storage.delete(path)
+    logger.info(f'Price list {name} imported: ' + ', '.join(f'{k}={v}' for k, v in report.items()))
+
+
+@app.task()
+def refresh_chain_offers():
+    refresh_offers()
+    bump_catalog_version()
+    logger.info('Chain offers refreshed')
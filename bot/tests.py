@@ -1,3 +1,35 @@
-from django.test import TestCase
+import numpy as np
+from django.test import SimpleTestCase
+from bot.basket import cheapest_split
 
-# Create your tests here.
+
+def brute_force_split(matrix):
+    best = np.inf
+    for i in range(len(matrix)):
+        for j in range(i + 1, len(matrix)):
+            best = min(best, np.minimum(matrix[i], matrix[j]).sum())
+    return best
+
+
+class CheapestSplitTest(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for pharmacies, medications in [(1, 3), (2, 1), (40, 2), (60, 5), (80, 10)]:
+            matrix = rng.integers(100, 10000, size=(pharmacies, medications)) / 100
+            matrix[rng.random(matrix.shape) < 0.4] = np.inf
+            with self.subTest(pharmacies=pharmacies, medications=medications):
+                single = matrix.sum(axis=1).min()
+                i, j, total = cheapest_split(matrix)
+                expected = brute_force_split(matrix)
+                # a split is only offered when it beats the cheapest single pharmacy
+                self.assertEqual(np.isfinite(total) and i != j and total < single, expected < single)
+                if expected < single:
+                    self.assertAlmostEqual(total, expected)
+                    self.assertAlmostEqual(np.minimum(matrix[i], matrix[j]).sum(), total)
+
+    def test_needs_a_pharmacy_that_is_not_the_cheapest_for_any_medication(self):
+        inf = np.inf
+        matrix = np.array([[1, inf, inf], [inf, 1, inf], [inf, inf, 1], [2, 2, inf]])
+        i, j, total = cheapest_split(matrix)
+        self.assertEqual({i, j}, {2, 3})
+        self.assertEqual(total, 5)
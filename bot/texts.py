@@ -21,3 +21,47 @@ before_search_button = 'Для начала нажмите кнопку поис
 after_search_message = 'Нажмите подробно для просмотра аптек где есть лекарство'
 
 in_detail_text = 'Подробно'
+
+page = 'Страница'
+
+previous_page = '◀️ Назад'
+
+next_page = 'Далее ▶️'
+
+subscribe_button = '🔔 Сообщить о снижении цены'
+
+subscribed = 'Я сообщу, когда цена станет ниже {price} грн.'
+
+price_drops = '📉 Цены снизились:'
+
+basket_button = '🧺 Корзина'
+
+add_to_basket_button = '🧺 Добавить в корзину'
+
+clear_basket_button = '🗑 Очистить корзину'
+
+basket_added = 'Добавлено в корзину, товаров: {count}'
+
+basket_full = 'В корзине может быть не больше {count} товаров'
+
+basket_empty = 'Корзина пуста. Найдите лекарство и нажмите «Добавить в корзину»'
+
+basket_cleared = 'Корзина очищена'
+
+basket = '🧺 <b>Корзина</b>'
+
+basket_pharmacy = '🏥 Дешевле всего в одной аптеке'
+
+basket_chain = '🔗 Дешевле всего в одной сети'
+
+basket_split = '🚶 Дешевле всего в двух аптеках'
+
+basket_not_available = 'Нет аптеки, где есть все товары из корзины'
+
+nearest_button = '📍 Ближайшие аптеки'
+
+nearest = 'Ближайшие аптеки, где есть'
+
+nearest_before_search = 'Сначала найдите лекарство, затем отправьте геопозицию'
+
+nearest_not_found = 'Рядом нет аптек с этим лекарством'
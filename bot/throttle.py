@@ -0,0 +1,89 @@
+import asyncio
+from django.conf import settings
+
+
+INTERACTIVE = 0
+BULK = 1
+
+PAUSE_KEY = 'telegram:pause'
+GLOBAL_KEY = 'telegram:bucket:global'
+
+# KEYS[1] is the pause key set after a 429, the rest are token buckets.
+# ARGV holds (rate per second, capacity, tokens required) for every bucket.
+# Tokens are taken from all buckets at once or from none, the reply is the
+# number of milliseconds to wait before trying again.
+ACQUIRE_SCRIPT = '''
+local pause = redis.call('PTTL', KEYS[1])
+if pause > 0 then
+    return pause
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local wait = 0
+local tokens = {}
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[(i - 2) * 3 + 1]) / 1000
+    local capacity = tonumber(ARGV[(i - 2) * 3 + 2])
+    local required = tonumber(ARGV[(i - 2) * 3 + 3])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    available = math.min(capacity, available + (now - ts) * rate)
+    if available < required then
+        wait = math.max(wait, math.ceil((required - available) / rate))
+    end
+    tokens[i] = available
+end
+if wait > 0 then
+    return wait
+end
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[(i - 2) * 3 + 1]) / 1000
+    local capacity = tonumber(ARGV[(i - 2) * 3 + 2])
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate) + 1000)
+end
+return 0
+'''
+
+
+class RateLimiter:
+    """Telegram rate limits shared by all sender processes through Redis."""
+
+    def __init__(self):
+        self._redis = None
+        self._script = None
+
+    def connect(self):
+        if self._redis is None:
+            from bot.misc import async_redis  # bot.misc imports the sender, which imports this module
+            self._redis = async_redis()
+            self._script = self._redis.register_script(ACQUIRE_SCRIPT)
+        return self._redis
+
+    def reset(self):
+        self._redis = None
+        self._script = None
+
+    async def acquire(self, chat_id=None, priority=INTERACTIVE):
+        reserve = settings.TELEGRAM_BULK_RESERVE if priority == BULK else 0
+        keys = [PAUSE_KEY, GLOBAL_KEY]
+        args = [settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_GLOBAL_RATE, 1 + reserve]
+        if chat_id is not None:
+            if str(chat_id).startswith('-'):
+                keys.append(f'telegram:bucket:group:{chat_id}')
+                args += [settings.TELEGRAM_GROUP_RATE / 60, settings.TELEGRAM_GROUP_RATE, 1]
+            else:
+                keys.append(f'telegram:bucket:chat:{chat_id}')
+                args += [settings.TELEGRAM_CHAT_RATE, settings.TELEGRAM_CHAT_BURST, 1]
+        self.connect()
+        while True:
+            wait = await self._script(keys=keys, args=args)
+            if not wait:
+                return
+            await asyncio.sleep(wait / 1000)
+
+    async def pause(self, seconds):
+        """Stop all senders for retry_after seconds after a 429."""
+        await self.connect().set(PAUSE_KEY, 1, px=int(seconds * 1000))
+